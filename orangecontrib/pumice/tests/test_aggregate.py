@@ -0,0 +1,68 @@
+import unittest
+
+import numpy as np
+
+from orangecontrib.pumice.weather.aggregate import (
+    group_codes, group_counts, group_reduce, used_groups)
+
+
+class TestAggregate(unittest.TestCase):
+    def setUp(self):
+        nan = np.nan
+        self.data = np.array([[1, 2],
+                              [3, nan],
+                              [5, 6],
+                              [nan, nan],
+                              [7, 8]])
+        self.codes = np.array([1, 0, 1, 2, -1])
+
+    def test_group_codes(self):
+        codes, uniques = group_codes(["b", "a", "", "b", None])
+        np.testing.assert_equal(codes, [1, 0, -1, 1, -1])
+        np.testing.assert_equal(uniques, ["a", "b"])
+
+        codes, uniques = group_codes(np.array([500, np.nan, 0, 500]))
+        np.testing.assert_equal(codes, [1, -1, 0, 1])
+        np.testing.assert_equal(uniques, [0, 500])
+
+        np.testing.assert_equal(group_counts(np.array([1, -1, 0, 1]), 3),
+                                [1, 2, 0])
+
+    def test_used_groups(self):
+        labels = np.array(["", "a", "b", "c"], dtype=object)
+        codes, used = used_groups(np.array([3, 0, 1, 3]), labels)
+        np.testing.assert_equal(codes, [1, -1, 0, 1])
+        np.testing.assert_equal(used, ["a", "c"])
+
+        codes, used = used_groups(np.array([2, 2]), labels)
+        np.testing.assert_equal(codes, [0, 0])
+        np.testing.assert_equal(used, ["b"])
+
+    def test_reductions(self):
+        nan = np.nan
+        data, codes = self.data, self.codes
+        np.testing.assert_equal(group_reduce(data, codes, 4),
+                                [[3, nan], [3, 4], [nan, nan], [nan, nan]])
+        np.testing.assert_equal(group_reduce(data, codes, 4, "min"),
+                                [[3, nan], [1, 2], [nan, nan], [nan, nan]])
+        np.testing.assert_equal(group_reduce(data, codes, 4, "max"),
+                                [[3, nan], [5, 6], [nan, nan], [nan, nan]])
+        np.testing.assert_equal(group_reduce(data, codes, 4, "count"),
+                                [[1, 0], [2, 2], [0, 0], [0, 0]])
+        self.assertRaises(ValueError, group_reduce, data, codes, 4, "median")
+
+    def test_matches_loop(self):
+        rng = np.random.default_rng(0)
+        data = rng.normal(size=(200, 3, 4))
+        data[rng.random(data.shape) < 0.2] = np.nan
+        codes = rng.integers(-1, 7, 200)
+        for how, func in (("mean", np.nanmean), ("min", np.nanmin),
+                          ("max", np.nanmax)):
+            expected = np.array([func(data[codes == code], axis=0)
+                                 for code in range(7)])
+            np.testing.assert_almost_equal(
+                group_reduce(data, codes, 7, how), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from orangecontrib.pumice.weather.blocks import BlockArray, write_blocks
+
+
+class TestBlockArray(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "S-MD-tavg.blocks")
+        self.arr = np.arange(23 * 12 * 2, dtype=float).reshape(23, 12, 2)
+        self.arr[5, 3] = np.nan
+        write_blocks(self.path, self.arr, block_rows=5)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_header(self):
+        arr = BlockArray(self.path)
+        self.assertEqual(arr.shape, (23, 12, 2))
+        self.assertEqual(arr.ndim, 3)
+        self.assertEqual(len(arr), 23)
+        self.assertEqual(arr.dtype, float)
+        self.assertEqual(arr.block_rows, 5)
+
+    def test_indexing(self):
+        arr, expected = BlockArray(self.path), self.arr
+        np.testing.assert_equal(arr[7], expected[7])
+        np.testing.assert_equal(arr[-1], expected[-1])
+        np.testing.assert_equal(arr[[22, 0, 5, 6]], expected[[22, 0, 5, 6]])
+        np.testing.assert_equal(arr[3:12], expected[3:12])
+        np.testing.assert_equal(arr[expected[:, 0, 0] > 100],
+                                expected[expected[:, 0, 0] > 100])
+        np.testing.assert_equal(arr[...], expected)
+        np.testing.assert_equal(arr[[4, 5], 3], expected[[4, 5], 3])
+        np.testing.assert_equal(arr[..., 1], expected[..., 1])
+        np.testing.assert_equal(arr[np.array([], dtype=int)],
+                                expected[np.array([], dtype=int)])
+        np.testing.assert_equal(np.asarray(arr), expected)
+        self.assertRaises(IndexError, arr.__getitem__, 23)
+
+    def test_reads_only_needed_blocks(self):
+        arr = BlockArray(self.path)
+        arr[[6, 8]]
+        self.assertEqual(list(arr._blocks), [1])
+        arr[[0, 22]]
+        self.assertEqual(list(arr._blocks), [1, 0, 4])
+
+    def test_invalid_file(self):
+        path = os.path.join(self.tmpdir.name, "foo.blocks")
+        with open(path, "wb") as f:
+            f.write(b"foo bar baz")
+        self.assertRaises(ValueError, BlockArray, path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,240 @@
+import io
+import os
+import glob
+import gzip
+import pickle
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from unittest.mock import patch
+
+import numpy as np
+
+from orangecontrib.pumice.weather import build
+from orangecontrib.pumice.weather.store import (
+    load_array, daily_partitions, monthly_years)
+
+
+STATIONS = """\
+SI000014015  46.0650   14.5170  299.0    LJUBLJANA BEZIGRAD
+SI000013014  46.5500   15.6500  275.0    MARIBOR
+US1ILAA0001  38.3905  -88.3501  140.8 IL FAIRFIELD
+"""
+
+COUNTRIES = """\
+SI Slovenia
+US United States
+"""
+
+CONTINENTS = """\
+Slovenia,Europe,Europe
+United States,North America,Americas
+"""
+
+
+def dly_line(code, year, month, element, values):
+    days = "".join(f"{value:5}   " if value is not None else "-9999   "
+                   for value in values + [None] * (31 - len(values)))
+    return f"{code}{year}{month:02}{element}{days}\n"
+
+
+class TestBuild(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.raw_dir = os.path.join(self.tmpdir.name, "raw")
+        self.out_dir = os.path.join(self.tmpdir.name, "out")
+        os.mkdir(self.raw_dir)
+        os.mkdir(self.out_dir)
+
+        for name, content in (("stations.txt", STATIONS),
+                              ("countries.txt", COUNTRIES),
+                              ("continents.csv", CONTINENTS)):
+            with open(os.path.join(self.tmpdir.name, name), "w") as f:
+                f.write(content)
+
+        # Ljubljana: January 2023 and 1995 in CSV, with one flagged value
+        with open(os.path.join(self.raw_dir, "SI000014015.csv"), "w") as f:
+            for year, base in ((2023, 0), (1995, 20)):
+                for day in range(1, 32):
+                    date = f"{year}01{day:02}"
+                    f.write(f"SI000014015,{date},TMAX,{base + 50},,,E,\n")
+                    f.write(f"SI000014015,{date},TMIN,{base - 10},,,E,\n")
+                    f.write(f"SI000014015,{date},PRCP,10,,,E,\n")
+            f.write("SI000014015,20230201,TMAX,999,,X,E,\n")
+
+        # Maribor: January 2023 in fixed-width format
+        with open(os.path.join(self.raw_dir, "SI000013014.dly"), "w") as f:
+            f.write(dly_line("SI000013014", 2023, 1, "TAVG", [30] * 31))
+            f.write(dly_line("SI000013014", 2023, 1, "PRCP", [20] * 20))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_csv(self):
+        dates, elements, values = build.read_csv(
+            os.path.join(self.raw_dir, "SI000014015.csv"))
+        # The flagged value is skipped
+        self.assertEqual(len(dates), 186)
+        self.assertEqual(dates[0], 20230101)
+        np.testing.assert_equal(elements[:3],
+                                [build.TMAX, build.TMIN, build.PRCP])
+        np.testing.assert_equal(values[:3], [50, -10, 10])
+
+        path = os.path.join(self.tmpdir.name, "header.csv")
+        with open(path, "w") as f:
+            f.write("ID,DATE,ELEMENT,DATA_VALUE,M_FLAG,Q_FLAG,S_FLAG,"
+                    "OBS_TIME\n"
+                    "US1,20230101,SNOW,5,,,E,\n"
+                    "US1,20230102,TAVG,-3,,,E,0700\n"
+                    "US1,20230103,TAVG,,,,E,\n")
+        dates, elements, values = build.read_csv(path)
+        np.testing.assert_equal(dates, [20230102])
+        np.testing.assert_equal(elements, [build.TAVG])
+        np.testing.assert_equal(values, [-3])
+
+        open(path, "w").close()
+        self.assertEqual([len(x) for x in build.read_csv(path)], [0, 0, 0])
+
+    def test_read_dly(self):
+        dates, elements, values = build.read_dly(
+            os.path.join(self.raw_dir, "SI000013014.dly"))
+        self.assertEqual(len(dates), 51)
+        self.assertEqual(dates[0], 20230101)
+        self.assertEqual(dates[-1], 20230120)
+        np.testing.assert_equal(elements[:31], build.TAVG)
+        np.testing.assert_equal(values[31:], 20)
+
+    def test_month_days(self):
+        days = build.MONTH_DAYS
+        self.assertEqual(days.shape, (build.N_YEARS, 12))
+        np.testing.assert_equal(days[2023 - build.FIRST_YEAR],
+                                [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+        # 1900 is not a leap year, 2000 is
+        self.assertEqual(days[0, 1], 28)
+        self.assertEqual(days[2000 - build.FIRST_YEAR, 1], 29)
+
+    def test_build(self):
+        path = self.tmpdir.name
+        station_data = build.station_table(
+            os.path.join(path, "stations.txt"),
+            os.path.join(path, "countries.txt"),
+            os.path.join(path, "continents.csv"))
+        self.assertEqual(station_data.get_column("Station")[2],
+                         "FAIRFIELD, IL US")
+
+        written = build.build(self.raw_dir, self.out_dir, year=2023,
+                              workers=1, station_data=station_data)
+        self.assertIn("S-MD-tspan", written)
+        self.assertIn("C-M2023-prcp", written)
+
+        def load(name):
+            return load_array(name, self.out_dir)
+
+        np.testing.assert_equal(load("countries"),
+                                [["Slovenia", "Europe"],
+                                 ["United States", "North America"]])
+
+        tavg = load("S-MT-tavg")
+        self.assertEqual(tavg.shape, (3, 12))
+        # Mean of 1995 (4) and 2023 (2) for Ljubljana
+        np.testing.assert_almost_equal(tavg[:, 0], [3, 3, np.nan])
+        self.assertTrue(np.all(np.isnan(tavg[:, 1:])))
+
+        by_decades = load("S-MD-tavg")
+        self.assertEqual(by_decades.shape, (3, 12, 13))
+        np.testing.assert_almost_equal(by_decades[0, 0, [9, 12]], [4, 2])
+
+        prcp = load("S-M2023-prcp")
+        np.testing.assert_almost_equal(prcp[:2, 0], [31, 62])
+        np.testing.assert_almost_equal(load("C-M2023-prcp")[0, 0], 46.5)
+
+        daily = load("S-Y2023-tmax")
+        self.assertEqual(daily.shape, (3, 365))
+        np.testing.assert_equal(daily[0, :31], 50)
+        self.assertTrue(np.isnan(daily[0, 31]))
+        np.testing.assert_equal(load("S-Y2023-tspan")[0, :31], 60)
+        np.testing.assert_equal(load("S-Y2023-mask"), [True, True, False])
+
+        # Adding a year does not rewrite other partitions
+        paths = glob.glob(os.path.join(self.out_dir, "S-Y2023-*"))
+        mtimes = [os.stat(path).st_mtime_ns for path in paths]
+        written = build.build_daily(self.raw_dir, self.out_dir, year=1995,
+                                    workers=1)
+        self.assertEqual(len(written), 7)
+        self.assertTrue(all(name.startswith("S-Y1995-") for name in written))
+        self.assertEqual([os.stat(path).st_mtime_ns for path in paths],
+                         mtimes)
+        self.assertEqual(list(daily_partitions(self.out_dir)), [1995, 2023])
+        np.testing.assert_equal(load("S-Y1995-tmax")[0, :31], 70)
+        np.testing.assert_equal(load("S-Y1995-mask"), [True, False, False])
+
+        # Partitions of other years must be built for the same stations
+        self.assertRaises(ValueError, build.build, self.raw_dir, self.out_dir,
+                          year=2023, workers=1, station_data=station_data[:2])
+        self.assertEqual(len(load_array("station-data", self.out_dir)), 3)
+        with gzip.open(os.path.join(self.out_dir, "station-data.pkl.gz"),
+                       "wb") as f:
+            pickle.dump(station_data[::-1], f)
+        self.assertRaises(ValueError, build.build_daily, self.raw_dir,
+                          self.out_dir, year=2022, workers=1)
+
+    def test_stale_monthly_values(self):
+        path = self.tmpdir.name
+        station_data = build.station_table(
+            os.path.join(path, "stations.txt"),
+            os.path.join(path, "countries.txt"))
+        written = build.build(self.raw_dir, self.out_dir, year=2023,
+                              workers=1, station_data=station_data)
+        self.assertIn("S-M2023-stations", written)
+        for name in glob.glob(os.path.join(self.out_dir, "S-Y*")):
+            os.remove(name)
+
+        # Monthly values for 2023 would not match the new stations
+        self.assertRaises(ValueError, build.build, self.raw_dir,
+                          self.out_dir, year=2022, workers=1,
+                          station_data=station_data[:2])
+        self.assertEqual(len(load_array("station-data", self.out_dir)), 3)
+        build.build(self.raw_dir, self.out_dir, year=2022, workers=1,
+                    station_data=station_data)
+        self.assertEqual(monthly_years(self.out_dir), [2022, 2023])
+
+    def test_interrupted_build(self):
+        path = self.tmpdir.name
+        station_data = build.station_table(
+            os.path.join(path, "stations.txt"),
+            os.path.join(path, "countries.txt"))
+        with patch.object(build, "save", side_effect=KeyboardInterrupt):
+            self.assertRaises(KeyboardInterrupt, build.build, self.raw_dir,
+                              self.out_dir, year=2023, workers=1,
+                              station_data=station_data)
+        self.assertEqual(os.listdir(self.out_dir), [])
+
+        build.build(self.raw_dir, self.out_dir, year=2023, workers=1,
+                    station_data=station_data)
+        self.assertIn("station-data.pkl.gz", os.listdir(self.out_dir))
+        self.assertFalse(glob.glob(os.path.join(self.out_dir, "*.tmp")))
+
+    def test_year_range(self):
+        build.check_year(build.FIRST_YEAR)
+        build.check_year(build.FIRST_YEAR + build.N_YEARS - 1)
+        last = build.FIRST_YEAR + build.N_YEARS
+        self.assertRaises(ValueError, build.check_year, last)
+        self.assertRaises(ValueError, build.check_year, build.FIRST_YEAR - 1)
+        self.assertRaises(ValueError, build.aggregate_stations,
+                          self.raw_dir, ["SI000014015"], last, 1)
+        self.assertRaises(ValueError, build.build, self.raw_dir,
+                          self.out_dir, year=last, workers=1)
+        self.assertEqual(os.listdir(self.out_dir), [])
+        with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            build.main([self.raw_dir, "-o", self.out_dir, "--year", str(last)])
+
+    def test_parallel(self):
+        codes = ["SI000014015", "SI000013014", "US1ILAA0001"]
+        serial = build.aggregate_stations(self.raw_dir, codes, 2023, 1)
+        parallel = build.aggregate_stations(self.raw_dir, codes, 2023, 2)
+        for s, p in zip(serial, parallel):
+            np.testing.assert_equal(s, p)
+
+
+if __name__ == "__main__":
+    unittest.main()
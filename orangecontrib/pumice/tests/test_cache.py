@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import Mock
+
+import numpy as np
+
+from orangecontrib.pumice.weather.cache import ArrayCache
+
+
+class TestArrayCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = ArrayCache(1000)
+        arr = np.zeros(10)
+        compute = Mock(return_value=arr)
+        self.assertIs(cache.get("S-MT-tavg", compute), arr)
+        self.assertIs(cache.get("S-MT-tavg", compute), arr)
+        compute.assert_called_once()
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.nbytes, 80)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+
+    def test_evicts_least_recently_used(self):
+        cache = ArrayCache(250)
+        for key in "abc":
+            cache.get(key, lambda: np.zeros(10))
+        cache.get("a", Mock())
+        cache.get("d", lambda: np.zeros(10))
+        self.assertEqual(set(cache._entries), {"a", "c", "d"})
+
+        cache.max_bytes = 100
+        self.assertEqual(set(cache._entries), {"d"})
+
+    def test_too_large_is_not_stored(self):
+        cache = ArrayCache(50)
+        arr = np.zeros(10)
+        self.assertIs(cache.get("a", lambda: arr), arr)
+        self.assertNotIn("a", cache)
+
+    def test_memmap_is_free(self):
+        cache = ArrayCache(0)
+        arr = np.zeros(10).view(np.memmap)
+        cache.get("a", lambda: arr)
+        self.assertIn("a", cache)
+        self.assertEqual(cache.nbytes, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
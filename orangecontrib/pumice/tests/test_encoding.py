@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from orangecontrib.pumice.weather.blocks import BlockArray, write_blocks
+from orangecontrib.pumice.weather.encoding import \
+    Encoding, EncodedArray, SENTINEL, write_encoded, load_encoded
+
+
+class TestEncoding(unittest.TestCase):
+    def setUp(self):
+        self.arr = np.array([[-12.34, 0, np.nan], [25.5, 3.1, 40.07]])
+
+    def test_int16(self):
+        encoding = Encoding.for_array(self.arr, 0.01)
+        self.assertEqual(encoding.dtype, np.int16)
+        self.assertEqual(encoding.scale, 0.01)
+
+        raw = encoding.encode(self.arr)
+        self.assertEqual(raw.dtype, np.int16)
+        self.assertEqual(raw[0, 2], SENTINEL)
+        decoded = encoding.decode(raw)
+        self.assertEqual(decoded.dtype, np.float32)
+        np.testing.assert_allclose(decoded, self.arr, atol=0.005)
+        self.assertTrue(np.isnan(decoded[0, 2]))
+
+        self.assertEqual(Encoding.from_dict(encoding.to_dict()), encoding)
+
+    def test_float32(self):
+        # range too large for int16 at this resolution
+        encoding = Encoding.for_array(self.arr, 0.0001)
+        self.assertEqual(encoding.dtype, np.float32)
+        self.assertIsNone(encoding.sentinel)
+        np.testing.assert_allclose(
+            encoding.decode(encoding.encode(self.arr)), self.arr, rtol=1e-6)
+
+        self.assertEqual(Encoding.for_array(self.arr).dtype, np.float32)
+        self.assertEqual(Encoding.for_array(np.array([np.inf]), 1).dtype,
+                         np.float32)
+
+    def test_empty_and_missing(self):
+        for arr in (np.full((2, 3), np.nan), np.zeros((0, 3))):
+            encoding = Encoding.for_array(arr, 0.1)
+            self.assertEqual(encoding.dtype, np.int16)
+            np.testing.assert_equal(encoding.decode(encoding.encode(arr)), arr)
+
+    def test_encoded_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "S-MT-tavg.enc")
+            encoding = Encoding.for_array(self.arr, 0.01)
+            write_encoded(path, self.arr, encoding)
+
+            arr = load_encoded(path)
+            self.assertIsInstance(arr.raw, np.memmap)
+            self.assertEqual(arr.encoding, encoding)
+            self.assertEqual(arr.shape, (2, 3))
+            self.assertEqual(len(arr), 2)
+            np.testing.assert_allclose(arr[1], self.arr[1], atol=0.005)
+            np.testing.assert_allclose(arr[:, 0], self.arr[:, 0], atol=0.005)
+            np.testing.assert_allclose(np.asarray(arr), self.arr, atol=0.005)
+            del arr
+
+    def test_encoded_blocks(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "S-MD-tavg.blocks")
+            encoding = Encoding.for_array(self.arr, 0.01)
+            write_blocks(path, self.arr, block_rows=1, encoding=encoding)
+            blocks = BlockArray(path)
+            self.assertEqual(blocks.encoding, encoding)
+            self.assertEqual(blocks.dtype, np.int16)
+
+            arr = EncodedArray(blocks, blocks.encoding)
+            np.testing.assert_allclose(arr[[1], 1:], self.arr[[1], 1:],
+                                       atol=0.005)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+
+import numpy as np
+
+from Orange.data import Table, Domain, StringVariable, ContinuousVariable
+
+from orangecontrib.pumice.weather.spatial import (
+    SpatialIndex, GridIndex, coordinates, points_in_polygon,
+    chord_to_km, km_to_chord)
+
+# Ljubljana, Maribor, Zagreb, unknown, Cairo, Vienna
+LATITUDES = [46.07, 46.55, 45.81, np.nan, 30.04, 48.21]
+LONGITUDES = [14.51, 15.65, 15.98, 10, 31.24, 16.37]
+
+
+class TestSpatialIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = SpatialIndex(LATITUDES, LONGITUDES)
+
+    def test_distances(self):
+        np.testing.assert_almost_equal(chord_to_km(km_to_chord(1234)), 1234)
+        # Ljubljana - Zagreb is about 117 km
+        _, distances = self.index.nearest(46.07, 14.51, k=3)
+        self.assertAlmostEqual(distances[0], 0)
+        self.assertAlmostEqual(distances[2], 117, delta=2)
+
+    def test_nearest(self):
+        index = self.index
+        self.assertEqual(len(index), 5)
+        rows, distances = index.nearest(46.0, 14.5, k=3)
+        np.testing.assert_equal(rows, [0, 1, 2])
+        self.assertTrue(np.all(np.diff(distances) > 0))
+
+        rows, _ = index.nearest(46.0, 14.5, k=10)
+        np.testing.assert_equal(rows, [0, 1, 2, 5, 4])
+
+        rows, _ = index.nearest(46.0, 14.5, k=10, radius=130)
+        np.testing.assert_equal(rows, [0, 1, 2])
+
+        rows, distances = index.nearest(0, 0, k=3, radius=10)
+        self.assertEqual(len(rows), 0)
+        self.assertEqual(len(distances), 0)
+
+    def test_within(self):
+        rows, distances = self.index.within(46.0, 14.5, 300)
+        np.testing.assert_equal(rows, [0, 1, 2, 5])
+        self.assertTrue(np.all(distances < 300))
+        self.assertEqual(len(self.index.within(0, 0, 10)[0]), 0)
+
+    def test_coordinates(self):
+        domain = Domain([], None, [StringVariable("Station"),
+                                   ContinuousVariable("Longitude"),
+                                   ContinuousVariable("Latitude")])
+        data = Table.from_list(domain, [["A", 14, 46], ["B", 15, 47]])
+        lat, lon = coordinates(data)
+        np.testing.assert_equal(lat, [46, 47])
+        np.testing.assert_equal(lon, [14, 15])
+
+        domain = Domain([ContinuousVariable("y"), ContinuousVariable("x")])
+        lat, _ = coordinates(Table.from_list(domain, [[46, 14], [47, 15]]))
+        np.testing.assert_equal(lat, [46, 47])
+
+        domain = Domain([ContinuousVariable("y")])
+        self.assertRaises(ValueError, coordinates,
+                          Table.from_list(domain, [[46]]))
+
+
+class TestGridIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = GridIndex(LATITUDES + [-16.5, 65],
+                               LONGITUDES + [179.5, -179])
+
+    def test_in_box(self):
+        index = self.index
+        self.assertEqual(len(index), 7)
+        # Slovenia and Croatia
+        np.testing.assert_equal(index.in_box(45, 13, 47, 17), [0, 1, 2])
+        np.testing.assert_equal(index.in_box(45, 15, 47, 17), [1, 2])
+        np.testing.assert_equal(index.in_box(45, 15, 46, 17), [2])
+        self.assertEqual(len(index.in_box(0, 0, 1, 1)), 0)
+        # Across the antimeridian
+        np.testing.assert_equal(index.in_box(-90, 170, 90, -170), [6, 7])
+        np.testing.assert_equal(index.in_box(-90, 179, 90, 180), [6])
+        # Entire world
+        np.testing.assert_equal(index.in_box(-90, -180, 90, 180),
+                                [0, 1, 2, 4, 5, 6, 7])
+
+    def test_in_polygon(self):
+        # A concave polygon with Ljubljana and Zagreb; the last point is
+        # within the bounding box, but in the notch of the polygon
+        lats = [45.5, 46.5, 46, 46.5, 45.5]
+        lons = [14, 14, 15.2, 16.5, 16.5]
+        index = GridIndex(LATITUDES + [46.4], LONGITUDES + [15.2])
+        np.testing.assert_equal(index.in_polygon(lats, lons), [0, 2])
+        np.testing.assert_equal(
+            points_in_polygon([14.51, 15.65, 15.98, 15.2],
+                              [46.07, 46.55, 45.81, 46.4], lons, lats),
+            [True, False, True, False])
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        lat = rng.uniform(-90, 90, 5000)
+        lon = rng.uniform(-180, 180, 5000)
+        index = GridIndex(lat, lon, cell=5)
+        expected = np.flatnonzero((lat >= -10) & (lat <= 30)
+                                  & (lon >= 20) & (lon <= 42.5))
+        np.testing.assert_equal(index.in_box(-10, 20, 30, 42.5), expected)
+
+        poly_lats, poly_lons = [-40, 50, 10], [-100, -60, 80]
+        expected = np.flatnonzero(
+            points_in_polygon(lon, lat, poly_lons, poly_lats))
+        np.testing.assert_equal(index.in_polygon(poly_lats, poly_lons),
+                                expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+import numpy as np
+
+from Orange.data import Table, Domain, StringVariable, DiscreteVariable
+
+from orangecontrib.pumice.weather.stations import StationIndex
+
+
+def station_table():
+    domain = Domain([], None, [
+        StringVariable("Code"), StringVariable("Station"),
+        StringVariable("Country"),
+        DiscreteVariable("Continent", values=("Africa", "Europe"))])
+    return Table.from_list(domain, [
+        ["SI1", "LJUBLJANA", "Slovenia", "Europe"],
+        ["EG1", "CAIRO", "Egypt", "Africa"],
+        ["SI2", "MARIBOR", "Slovenia", "Europe"],
+        ["XX1", "SHIP", "", None],
+        ["SI3", "LJUBLJANA", "Slovenia", "Europe"]])
+
+
+class TestStationIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = StationIndex(station_table())
+
+    def test_single_lookups(self):
+        index = self.index
+        np.testing.assert_equal(index.by_name("LJUBLJANA"), [0, 4])
+        np.testing.assert_equal(index.by_name("CAIRO"), [1])
+        np.testing.assert_equal(index.by_name("PARIS"), [])
+        np.testing.assert_equal(index.by_code("SI2"), [2])
+        np.testing.assert_equal(index.by_country("Slovenia"), [0, 2, 4])
+
+    def test_multiple_lookups(self):
+        index = self.index
+        rows, found = index.by_names(["MARIBOR", "LJUBLJANA", "PARIS"])
+        np.testing.assert_equal(rows, [0, 2, 4])
+        self.assertEqual(found, 2)
+
+        rows, found = index.by_codes(["SI3", "EG1", "EG1"])
+        np.testing.assert_equal(rows, [1, 4])
+        self.assertEqual(found, 2)
+
+        rows, found = index.by_names([])
+        np.testing.assert_equal(rows, [])
+        self.assertEqual(found, 0)
+
+    def test_codes(self):
+        index = self.index
+        np.testing.assert_equal(index.countries,
+                                ["", "Egypt", "Slovenia"])
+        np.testing.assert_equal(index.country_codes, [2, 1, 2, 0, 2])
+        np.testing.assert_equal(index.continents, ["", "Africa", "Europe"])
+        np.testing.assert_equal(index.continent_codes, [2, 1, 2, 0, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
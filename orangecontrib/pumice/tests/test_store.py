@@ -0,0 +1,172 @@
+import os
+import gzip
+import pickle
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from orangecontrib.pumice.weather import store
+from orangecontrib.pumice.weather.blocks import BlockArray
+from orangecontrib.pumice.weather.convert import convert, derive
+from orangecontrib.pumice.weather.encoding import EncodedArray
+
+
+class TestStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.data_dir = self.tmpdir.name
+        self.arr = np.arange(24, dtype=float).reshape(4, 6)
+        self._pickle("S-MT-tavg", self.arr)
+        self._pickle("countries",
+                     np.array([["Slovenia", "Europe"], ["Peru", "South America"]]))
+        self._pickle("station-data", object())
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _pickle(self, name, arr):
+        with gzip.open(store.array_path(name, ".pkl.gz", self.data_dir),
+                       "wb") as f:
+            pickle.dump(arr, f)
+
+    def test_load_pickle(self):
+        arr = store.load_array("S-MT-tavg", self.data_dir)
+        self.assertNotIsInstance(arr, np.memmap)
+        np.testing.assert_equal(arr, self.arr)
+        self.assertTrue(store.has_array("S-MT-tavg", self.data_dir))
+        self.assertFalse(store.has_array("S-MT-tmin", self.data_dir))
+
+    def test_convert_and_mmap(self):
+        converted = convert(data_dir=self.data_dir)
+        self.assertEqual(converted, ["S-MT-tavg", "countries"])
+
+        arr = store.load_array("S-MT-tavg", self.data_dir)
+        self.assertIsInstance(arr, EncodedArray)
+        self.assertIsInstance(arr.raw, np.memmap)
+        self.assertEqual(arr.raw.dtype, np.int16)
+        np.testing.assert_equal(np.asarray(arr), self.arr)
+        np.testing.assert_equal(arr[[1, 3]], self.arr[[1, 3]])
+        np.testing.assert_equal(
+            store.load_array("countries", self.data_dir)[:, 0],
+            ["Slovenia", "Peru"])
+
+    def test_convert_blocks(self):
+        self._pickle("S-MD-tavg", self.arr)
+        convert(["S-MD-tavg", "S-MT-tavg"], data_dir=self.data_dir)
+        self.assertTrue(os.path.exists(
+            store.array_path("S-MD-tavg", ".blocks", self.data_dir)))
+        self.assertTrue(os.path.exists(
+            store.array_path("S-MT-tavg", ".enc", self.data_dir)))
+
+        arr = store.load_array("S-MD-tavg", self.data_dir)
+        self.assertIsInstance(arr, EncodedArray)
+        self.assertIsInstance(arr.raw, BlockArray)
+        np.testing.assert_equal(arr[[1, 3]], self.arr[[1, 3]])
+
+        convert(["S-MD-tavg"], data_dir=self.data_dir, fmt="npy")
+        self.assertFalse(os.path.exists(
+            store.array_path("S-MD-tavg", ".blocks", self.data_dir)))
+        self.assertIsInstance(
+            store.load_array("S-MD-tavg", self.data_dir), np.memmap)
+
+        convert(["S-MD-tavg"], data_dir=self.data_dir, fmt="enc")
+        self.assertFalse(os.path.exists(
+            store.array_path("S-MD-tavg", ".npy", self.data_dir)))
+        self.assertIsInstance(
+            store.load_array("S-MD-tavg", self.data_dir), EncodedArray)
+
+    def test_convert_daily_exact(self):
+        # Daily temperatures are in tenths; averages of extremes in halves
+        tavg = np.array([[-12.5, 0, np.nan], [251, 30.5, -0.5]])
+        self._pickle("S-Y2024-tavg", tavg)
+        self._pickle("S-Y2024-tmax", np.round(tavg))
+        convert(["S-Y2024-tavg", "S-Y2024-tmax"], data_dir=self.data_dir)
+        np.testing.assert_equal(
+            store.load_array("S-Y2024-tavg", self.data_dir)[:], tavg)
+        np.testing.assert_equal(
+            store.load_array("S-Y2024-tmax", self.data_dir)[:], np.round(tavg))
+
+    def test_convert_remove(self):
+        convert(["S-MT-tavg"], data_dir=self.data_dir, remove=True)
+        self.assertFalse(os.path.exists(
+            store.array_path("S-MT-tavg", ".pkl.gz", self.data_dir)))
+        self.assertTrue(os.path.exists(
+            store.array_path("countries", ".pkl.gz", self.data_dir)))
+        np.testing.assert_equal(
+            store.load_array("S-MT-tavg", self.data_dir), self.arr)
+
+    def test_derive(self):
+        self._pickle("S-MT-tmax", self.arr + 5)
+        self._pickle("S-MT-tmin", self.arr + 2)
+        self._pickle("C-MT-tmax", self.arr)
+        self.assertEqual(derive(self.data_dir), ["S-MT-tspan"])
+        self.assertEqual(derive(self.data_dir, prefixes=["C-MT-"]), [])
+        np.testing.assert_equal(
+            np.asarray(store.load_array("S-MT-tspan", self.data_dir)), 3)
+
+    def test_daily_partitions(self):
+        self.assertEqual(store.daily_partitions(self.data_dir), {})
+        self._pickle("S-Y-mask", np.ones(4, dtype=bool))
+        self.assertEqual(store.daily_partitions(self.data_dir),
+                         {2024: "S-Y-"})
+        self._pickle("S-Y2025-mask", np.ones(4, dtype=bool))
+        self._pickle("S-Y2023-mask", np.ones(4, dtype=bool))
+        self._pickle("S-Y2023-tavg", self.arr)
+        convert(["S-Y2023-mask"], data_dir=self.data_dir, remove=True)
+        partitions = store.daily_partitions(self.data_dir)
+        self.assertEqual(list(partitions), [2023, 2024, 2025])
+        self.assertEqual(partitions[2023], "S-Y2023-")
+
+        self._pickle("S-Y2024-mask", np.ones(4, dtype=bool))
+        self.assertEqual(store.daily_partitions(self.data_dir)[2024],
+                         "S-Y2024-")
+
+    def test_partition_matches(self):
+        codes = ["SI1", "SI2", "AT1", "AT2"]
+        self._pickle("S-Y2023-mask", np.ones(4, dtype=bool))
+        self._pickle("S-Y2023-stations", store.stations_digest(codes))
+        convert(["S-Y2023-stations"], data_dir=self.data_dir)
+        self.assertTrue(store.partition_matches("S-Y2023-", codes,
+                                                self.data_dir))
+        self.assertFalse(store.partition_matches("S-Y2023-", codes[::-1],
+                                                 self.data_dir))
+
+        # Older partitions without a digest: check the number of stations
+        self._pickle("S-Y-mask", np.ones(4, dtype=bool))
+        self.assertTrue(store.partition_matches("S-Y-", codes, self.data_dir))
+        self.assertFalse(store.partition_matches("S-Y-", codes[:3],
+                                                 self.data_dir))
+
+    def test_monthly_years(self):
+        self.assertEqual(store.monthly_years(self.data_dir), [])
+        self._pickle("S-M2024-tavg", self.arr)
+        self._pickle("S-M2023-prcp", self.arr)
+        self._pickle("C-M2022-tavg", self.arr)
+        self._pickle("S-M2021-tavg", self.arr)
+        convert(["S-M2021-tavg"], data_dir=self.data_dir, remove=True)
+        self.assertEqual(store.monthly_years(self.data_dir), [2021, 2024])
+
+        # Years built for other stations are skipped if codes are given
+        codes = ["SI1", "SI2", "AT1", "AT2"]
+        self.assertEqual(store.monthly_years(self.data_dir, codes),
+                         [2021, 2024])
+        self._pickle("S-M2024-stations", store.stations_digest(codes[::-1]))
+        self.assertEqual(store.monthly_years(self.data_dir, codes), [2021])
+        self.assertEqual(store.monthly_years(self.data_dir, codes[:3]), [])
+
+    def test_get_derived_array(self):
+        try:
+            store.array_cache.clear()
+            with patch.object(store, "DATA_DIR", self.data_dir):
+                self._pickle("S-MT-tmax", self.arr + 5)
+                self._pickle("S-MT-tmin", self.arr + 2)
+                np.testing.assert_equal(store.get_array("S-MT-tspan"), 3)
+                self.assertIn("S-MT-tspan", store.array_cache)
+        finally:
+            store.array_cache.clear()
+
+
+if __name__ == "__main__":
+    unittest.main()
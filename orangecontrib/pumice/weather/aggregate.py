@@ -0,0 +1,116 @@
+"""
+NaN-aware reductions of arrays by groups of rows.
+
+Rows are assigned to groups by integer codes (see `group_codes`). Sums,
+means and counts are computed with `np.bincount` over the flattened array,
+minima and maxima with `np.fmin.reduceat` and `np.fmax.reduceat` over rows
+sorted by groups, so reductions cost about as much as a pass over the data.
+"""
+import numpy as np
+
+# Reductions supported by `group_reduce`
+REDUCTIONS = ("mean", "min", "max", "count")
+
+
+def group_codes(values):
+    """
+    Return group codes for the given values, and sorted unique values.
+
+    Missing values (empty strings, None or nan) get code -1.
+
+    :param values: array of strings or numbers
+    :return: codes (np.ndarray of int) and unique values
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        missing = np.isnan(values)
+    elif values.dtype == object:
+        missing = np.array([value is None or value == "" for value in values],
+                           dtype=bool)
+    else:
+        missing = values == ""
+    codes = np.full(len(values), -1)
+    uniques, codes[~missing] = np.unique(values[~missing], return_inverse=True)
+    return codes, uniques
+
+
+def used_groups(codes, labels):
+    """
+    Renumber groups to those that occur in `codes`; groups with empty
+    labels are dropped and their rows get code -1.
+
+    :param codes: group index for each row
+    :param labels: labels of all groups (np.ndarray)
+    :return: new codes and labels of used groups
+    """
+    codes = np.where(labels[codes] != "", codes, -1)
+    used, codes = np.unique(codes, return_inverse=True)
+    codes = codes.reshape(-1)
+    if len(used) and used[0] == -1:
+        used = used[1:]
+        codes -= 1
+    return codes, labels[used]
+
+
+def group_counts(codes, ngroups):
+    """Return the number of rows in each group; rows with code -1 are skipped."""
+    return np.bincount(codes[codes >= 0], minlength=ngroups)
+
+
+def _bincount_sums(flat, codes, ngroups):
+    """Return sums of known values and their counts, by groups and columns."""
+    ncols = flat.shape[1]
+    known = ~np.isnan(flat)
+    keys = (codes[:, None] * ncols + np.arange(ncols)).ravel()
+    size = ngroups * ncols
+    sums = np.bincount(keys, weights=np.where(known, flat, 0).ravel(),
+                       minlength=size)
+    counts = np.bincount(keys, weights=known.ravel(), minlength=size)
+    return sums.reshape(ngroups, ncols), counts.reshape(ngroups, ncols)
+
+
+def _extremes(flat, codes, ngroups, func):
+    """Return minima or maxima (`func` is np.fmin or np.fmax) by groups."""
+    out = np.full((ngroups, flat.shape[1]), np.nan)
+    order = np.argsort(codes, kind="stable")
+    sizes = np.bincount(codes, minlength=ngroups)
+    nonempty = np.flatnonzero(sizes)
+    if len(nonempty):
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))[nonempty]
+        out[nonempty] = func.reduceat(flat[order], starts, axis=0)
+    return out
+
+
+def group_reduce(data, codes, ngroups, how="mean"):
+    """
+    Reduce rows of `data` by groups, ignoring NaNs.
+
+    Groups without known values get NaN (or 0 for "count"). Rows with code
+    -1 are skipped.
+
+    :param data: array with rows in the first dimension
+    :param codes: group index for each row
+    :param ngroups: number of groups
+    :param how: one of `REDUCTIONS`
+    :return: array of shape (ngroups, ) + data.shape[1:]
+    """
+    data = np.asarray(data, dtype=float)
+    codes = np.asarray(codes)
+    keep = codes >= 0
+    if not keep.all():
+        data, codes = data[keep], codes[keep]
+    flat = data.reshape(len(data), -1)
+    if how in ("mean", "count"):
+        sums, counts = _bincount_sums(flat, codes, ngroups)
+        if how == "count":
+            result = counts
+        else:
+            with np.errstate(invalid="ignore"):
+                result = sums / counts
+    elif how == "min":
+        result = _extremes(flat, codes, ngroups, np.fmin)
+    elif how == "max":
+        result = _extremes(flat, codes, ngroups, np.fmax)
+    else:
+        raise ValueError(f"unknown reduction: {how}")
+    return result.reshape((ngroups, ) + data.shape[1:])
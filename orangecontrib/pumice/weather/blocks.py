@@ -0,0 +1,167 @@
+"""
+Container for arrays, compressed in separate blocks of rows.
+
+The file starts with a magic string and the length of a JSON header, which
+contains the dtype and shape of the array, the number of rows per block,
+offsets of compressed blocks and, optionally, the encoding of values (see
+`encoding.py`). Blocks follow the header; each is compressed with zlib.
+
+Indexing a `BlockArray` decompresses only the blocks that contain the
+requested rows, so a query for a single station in a file with daily data
+for all stations reads a few hundred kilobytes instead of the entire file.
+"""
+import os
+import json
+import zlib
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from orangecontrib.pumice.weather.encoding import Encoding
+
+MAGIC = b"PMCBLK01"
+_LENGTH = struct.Struct("<Q")
+
+# Default number of rows in a block
+BLOCK_ROWS = 256
+
+# Number of decompressed blocks kept by each BlockArray
+CACHED_BLOCKS = 16
+
+
+def write_blocks(path, arr, block_rows=BLOCK_ROWS, level=6, encoding=None):
+    """
+    Write array `arr` into a block container at `path`.
+
+    If `encoding` is given, the array is encoded before it is stored, and
+    the encoding is stored in the header.
+
+    The file is first written to a temporary file, which then replaces
+    the target.
+
+    :param path: file name
+    :param arr: array to write
+    :param block_rows: number of rows in a block
+    :param level: zlib compression level
+    :param encoding: encoding of values (optional)
+    """
+    arr = np.asarray(arr)
+    if arr.ndim == 0 or arr.dtype == object:
+        raise ValueError("Only arrays of numbers or strings can be stored")
+    if encoding is not None:
+        arr = encoding.encode(arr)
+    blocks = [
+        zlib.compress(np.ascontiguousarray(arr[start:start + block_rows]),
+                      level)
+        for start in range(0, len(arr), block_rows)]
+    offsets = np.cumsum([0] + [len(block) for block in blocks]).tolist()
+    header = dict(dtype=arr.dtype.str, shape=arr.shape,
+                  block_rows=block_rows, offsets=offsets)
+    if encoding is not None:
+        header["encoding"] = encoding.to_dict()
+    header = json.dumps(header).encode("ascii")
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(len(header)))
+        f.write(header)
+        for block in blocks:
+            f.write(block)
+    os.replace(tmp_path, path)
+
+
+class BlockArray:
+    """
+    Read-only array stored in a block container.
+
+    The class supports indexing of rows (with an integer, slice, array of
+    indices or of booleans, or Ellipsis), optionally followed by indices for
+    further dimensions, e.g. `arr[[3, 5], 2]`, which are applied to the
+    selected rows. Results are numpy arrays of stored values; if values
+    are encoded, `store.load_array` wraps the container into `EncodedArray`.
+    Conversion to numpy array (`np.asarray(arr)`) decompresses all blocks.
+
+    Attributes:
+        path (str): file name
+        shape (tuple of int): array shape
+        dtype (np.dtype): array type
+        block_rows (int): number of rows in a block
+        encoding (Encoding or None): encoding of stored values
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a block container")
+            length, = _LENGTH.unpack(f.read(_LENGTH.size))
+            header = json.loads(f.read(length))
+            self._data_start = f.tell()
+        self.dtype = np.dtype(header["dtype"])
+        self.shape = tuple(header["shape"])
+        self.block_rows = header["block_rows"]
+        self._offsets = header["offsets"]
+        encoding = header.get("encoding")
+        self.encoding = encoding and Encoding.from_dict(encoding)
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self._rows(np.arange(len(self)))
+        return arr if dtype is None else arr.astype(dtype)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            key, rest = (key[0], key[1:]) if key else (..., ())
+        else:
+            rest = ()
+        if key is ...:
+            return np.asarray(self)[(..., ) + rest]
+
+        if isinstance(key, (int, np.integer)):
+            key = int(key)
+            if not -len(self) <= key < len(self):
+                raise IndexError(f"index {key} is out of bounds")
+            return self._rows(np.array([key % len(self)]))[0][rest]
+        rows = np.arange(len(self))[key]
+        return self._rows(rows)[(slice(None), ) + rest]
+
+    def _rows(self, rows):
+        """Return the given rows (an array of non-negative indices)."""
+        out = np.empty((len(rows), ) + self.shape[1:], dtype=self.dtype)
+        if not len(rows):
+            return out
+        block_ids = rows // self.block_rows
+        order = np.argsort(block_ids, kind="stable")
+        unique, starts = np.unique(block_ids[order], return_index=True)
+        for block_id, positions in zip(unique, np.split(order, starts[1:])):
+            block = self._block(int(block_id))
+            out[positions] = block[rows[positions] - block_id * self.block_rows]
+        return out
+
+    def _block(self, block_id):
+        with self._lock:
+            if block_id in self._blocks:
+                self._blocks.move_to_end(block_id)
+                return self._blocks[block_id]
+        start, end = self._offsets[block_id:block_id + 2]
+        with open(self.path, "rb") as f:
+            f.seek(self._data_start + start)
+            data = zlib.decompress(f.read(end - start))
+        nrows = min(self.block_rows, len(self) - block_id * self.block_rows)
+        block = np.frombuffer(data, dtype=self.dtype) \
+            .reshape((nrows, ) + self.shape[1:])
+        with self._lock:
+            self._blocks[block_id] = block
+            while len(self._blocks) > CACHED_BLOCKS:
+                self._blocks.popitem(last=False)
+        return block
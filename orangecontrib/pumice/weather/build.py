@@ -0,0 +1,577 @@
+"""
+Build weather datasets from raw daily station data.
+
+Input are daily observations in GHCN-Daily format, one file per station,
+named by station code: either CSV (`<code>.csv`, with columns ID, DATE,
+ELEMENT, DATA_VALUE, M_FLAG, Q_FLAG, S_FLAG, OBS_TIME, as in GHCN's
+`by_station` directory), or fixed-width (`<code>.dly`). Values are in
+tenths of degrees Celsius and tenths of millimeters; values with a quality
+flag are ignored. Missing daily averages are computed from daily extremes.
+
+Stations are read from `station-data.pkl.gz` in the output directory, or
+from `ghcnd-stations.txt` (option `--stations`), together with names of
+countries from `ghcnd-countries.txt` and, optionally, a CSV file with
+columns country, continent and region.
+
+Stations are aggregated in parallel worker processes. The script writes
+the files described in `datasets/weather/README.md`: S-MT, S-MD, S-M<year>
+and S-Y<year> (daily values for the given year) for all stations, C-MT, C-MD
+and C-M<year> for countries, `countries` and `station-data`.
+
+With `--daily-only`, the script only adds daily values for the given year
+to existing data: it writes S-Y<year> for stations from the existing
+`station-data.pkl.gz`, and does not touch partitions for other years.
+
+Daily partitions and monthly values (S-M<year>) of other years are kept, so
+they must have been built for the same stations (see `check_partitions`);
+otherwise the script stops before writing anything.
+
+Usage:
+
+    python -m orangecontrib.pumice.weather.build RAW_DIR [-o OUT_DIR]
+        [--year YEAR] [--daily-only] [-j WORKERS] [-f {auto,npy,enc,blocks}]
+        [--stations ghcnd-stations.txt --countries ghcnd-countries.txt
+         [--continents continents.csv]]
+"""
+import os
+import csv
+import gzip
+import pickle
+import argparse
+import calendar
+import datetime
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from Orange.data import (
+    Table, Domain, StringVariable, DiscreteVariable, ContinuousVariable)
+
+from orangecontrib.pumice.weather.aggregate import group_reduce
+from orangecontrib.pumice.weather.convert import save, derive
+from orangecontrib.pumice.weather.store import (
+    DATA_DIR, daily_prefix, daily_partitions, monthly_prefix, monthly_years,
+    partition_matches, stations_digest)
+
+PROPS = ("tavg", "tmin", "tmax", "prcp")
+ELEMENTS = {b"TAVG": 0, b"TMIN": 1, b"TMAX": 2, b"PRCP": 3}
+TAVG, TMIN, TMAX, PRCP = range(4)
+
+CSV_COLUMNS = ("ID", "DATE", "ELEMENT", "DATA_VALUE", "M_FLAG", "Q_FLAG",
+               "S_FLAG", "OBS_TIME")
+CSV_ELEMENTS = {name.decode(): index for name, index in ELEMENTS.items()}
+
+# Monthly values are stored for years FIRST_YEAR to FIRST_YEAR + N_YEARS - 1
+FIRST_YEAR = 1900
+N_DECADES = 13
+N_YEARS = 10 * N_DECADES
+
+# Numbers of days in months, shape (N_YEARS, 12)
+MONTH_DAYS = np.diff(
+    (np.datetime64(f"{FIRST_YEAR}-01") + np.arange(N_YEARS * 12 + 1))
+    .astype("datetime64[D]")).astype(int).reshape(N_YEARS, 12)
+
+# Minimal number of daily values for a valid monthly value
+MIN_DAYS = 15
+
+# Number of stations processed by a worker at once
+CHUNK_SIZE = 256
+
+
+def days_in_year(year):
+    return 365 + calendar.isleap(year)
+
+
+def check_year(year):
+    """
+    Raise `ValueError` if `year` is outside the years for which monthly
+    values are stored.
+    """
+    if not FIRST_YEAR <= year < FIRST_YEAR + N_YEARS:
+        raise ValueError(
+            f"Year {year} is outside years {FIRST_YEAR}-"
+            f"{FIRST_YEAR + N_YEARS - 1}; increase N_DECADES to add it")
+
+
+def read_csv(path):
+    """
+    Read a GHCN-Daily CSV file.
+
+    The file is parsed by pandas' C parser; unknown elements, missing values
+    and values with a quality flag are then removed with vectorized masks.
+
+    :return: dates (as yyyymmdd), element indices (see `ELEMENTS`) and values
+    """
+    with open(path, "rb") as f:
+        has_header = f.readline().startswith(b"ID,")
+    # Dates are parsed as floats, since they are missing in incomplete rows
+    try:
+        frame = pd.read_csv(
+            path, header=None, names=CSV_COLUMNS, skiprows=int(has_header),
+            usecols=("DATE", "ELEMENT", "DATA_VALUE", "Q_FLAG"),
+            dtype={"DATE": float, "ELEMENT": "category",
+                   "DATA_VALUE": float, "Q_FLAG": "category"})
+    except pd.errors.EmptyDataError:
+        return (np.empty(0, dtype=int), ) * 2 + (np.empty(0), )
+    elements = frame["ELEMENT"].map(CSV_ELEMENTS).to_numpy(dtype=float)
+    valid = np.isfinite(elements) \
+        & frame["Q_FLAG"].isna().to_numpy() \
+        & frame["DATE"].notna().to_numpy() \
+        & frame["DATA_VALUE"].notna().to_numpy()
+    return (frame["DATE"].to_numpy()[valid].astype(int),
+            elements[valid].astype(int),
+            frame["DATA_VALUE"].to_numpy()[valid])
+
+
+def read_dly(path):
+    """
+    Read a GHCN-Daily fixed-width file.
+
+    :return: dates (as yyyymmdd), element indices (see `ELEMENTS`) and values
+    """
+    with open(path, "rb") as f:
+        lines = f.read().splitlines()
+    lines = np.array([line.ljust(269) for line in lines if len(line) >= 21],
+                     dtype="S269")
+    if not len(lines):
+        return (np.empty(0, dtype=int), ) * 2 + (np.empty(0), )
+    chars = lines.view("S1").reshape(len(lines), 269)
+
+    def field(start, end):
+        return chars[:, start:end].copy().view(f"S{end - start}")[:, 0]
+
+    known = np.isin(field(17, 21), list(ELEMENTS))
+    chars = chars[known]
+    months = field(11, 17)[known].astype(int)
+    elements = np.array([ELEMENTS[e] for e in field(17, 21)[known]],
+                        dtype=int)
+    # 31 days per line, each with 5 characters of value and 3 flags
+    days = chars[:, 21:].reshape(len(chars), 31, 8)
+    values = days[:, :, :5].copy().view("S5")[:, :, 0].astype(float)
+    valid = (values != -9999) & (days[:, :, 6] == b" ")
+    line_idx, day_idx = np.nonzero(valid)
+    return (months[line_idx] * 100 + day_idx + 1,
+            elements[line_idx],
+            values[line_idx, day_idx])
+
+
+def read_station(raw_dir, code):
+    """
+    Read daily data for station `code` from `raw_dir`.
+
+    Return `None` if there is no file for the station.
+    """
+    for ext, reader in ((".csv", read_csv), (".dly", read_dly)):
+        path = os.path.join(raw_dir, code + ext)
+        if os.path.exists(path):
+            return reader(path)
+    return None
+
+
+def add_daily_averages(dates, elements, values):
+    """
+    Add daily averages, computed as means of daily extremes, for days that
+    have extremes, but not averages.
+    """
+    def of(element):
+        mask = elements == element
+        return dates[mask], values[mask]
+
+    (tmax_d, tmax_v), (tmin_d, tmin_v), (tavg_d, _) = \
+        of(TMAX), of(TMIN), of(TAVG)
+    common, imax, imin = np.intersect1d(tmax_d, tmin_d, return_indices=True)
+    missing = ~np.isin(common, tavg_d)
+    return (
+        np.concatenate((dates, common[missing])),
+        np.concatenate((elements, np.full(np.sum(missing), TAVG))),
+        np.concatenate(
+            (values, (tmax_v[imax] + tmin_v[imin])[missing] / 2)))
+
+
+def monthly_values(dates, elements, values):
+    """
+    Compute monthly values from daily values.
+
+    :return: array of shape (len(PROPS), N_YEARS, 12) with monthly means of
+        temperatures in degrees Celsius and monthly sums of precipitation
+        in mm; months with fewer than MIN_DAYS values are NaN, and values
+        outside years FIRST_YEAR to FIRST_YEAR + N_YEARS - 1 are ignored
+    """
+    years = dates // 10000
+    inside = (years >= FIRST_YEAR) & (years < FIRST_YEAR + N_YEARS)
+    dates, elements, values = dates[inside], elements[inside], values[inside]
+    months = (dates // 10000 - FIRST_YEAR) * 12 + dates // 100 % 100 - 1
+    size = len(PROPS) * N_YEARS * 12
+    keys = elements * N_YEARS * 12 + months
+    counts = np.bincount(keys, minlength=size)
+    sums = np.bincount(keys, weights=values, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts / 10
+    means[counts < MIN_DAYS] = np.nan
+    means = means.reshape(len(PROPS), N_YEARS, 12)
+
+    # Sum of precipitation, corrected for missing days
+    means[PRCP] *= MONTH_DAYS
+    return means
+
+
+def daily_values(dates, elements, values, year):
+    """
+    Return daily values for the given year.
+
+    :return: array of shape (len(PROPS), 365 or 366); temperatures are in
+        tenths of degrees, as in the source, and precipitation in mm
+    """
+    start = np.datetime64(f"{year}-01-01")
+    daily = np.full((len(PROPS), days_in_year(year)), np.nan)
+    inside = dates // 10000 == year
+    dates, elements, values = dates[inside], elements[inside], values[inside]
+    month_starts = ((dates // 100 % 100 - 1) + (year - 1970) * 12) \
+        .astype("datetime64[M]").astype("datetime64[D]")
+    days = (month_starts + (dates % 100 - 1) - start).astype(int)
+    daily[elements, days] = values
+    daily[PRCP] /= 10
+    return daily
+
+
+def aggregate_station(dates, elements, values, year):
+    """
+    Aggregate daily data for a single station.
+
+    :return: a tuple with arrays of all-time monthly means (len(PROPS), 12),
+        monthly means by decades (len(PROPS), 12, N_DECADES), monthly values
+        for the given year (len(PROPS), 12) and daily values for the year
+        (len(PROPS), 365 or 366)
+    """
+    dates, elements, values = add_daily_averages(dates, elements, values)
+    monthly = monthly_values(dates, elements, values)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        total = np.nanmean(monthly, axis=1)
+        by_decades = np.nanmean(
+            monthly.reshape(len(PROPS), N_DECADES, 10, 12), axis=2)
+    return (total, by_decades.transpose(0, 2, 1),
+            monthly[:, year - FIRST_YEAR],
+            daily_values(dates, elements, values, year))
+
+
+def _aggregate_chunk(args):
+    raw_dir, codes, year = args
+    ndays = days_in_year(year)
+    n = len(codes)
+    total = np.full((len(PROPS), n, 12), np.nan)
+    by_decades = np.full((len(PROPS), n, 12, N_DECADES), np.nan)
+    last_year = np.full((len(PROPS), n, 12), np.nan)
+    daily = np.full((len(PROPS), n, ndays), np.nan)
+    for i, code in enumerate(codes):
+        data = read_station(raw_dir, code)
+        if data is None or not len(data[0]):
+            continue
+        total[:, i], by_decades[:, i], last_year[:, i], daily[:, i] = \
+            aggregate_station(*data, year)
+    return total, by_decades, last_year, daily
+
+
+def _daily_chunk(args):
+    raw_dir, codes, year = args
+    daily = np.full((len(PROPS), len(codes), days_in_year(year)), np.nan)
+    for i, code in enumerate(codes):
+        data = read_station(raw_dir, code)
+        if data is None or not len(data[0]):
+            continue
+        daily[:, i] = daily_values(*add_daily_averages(*data), year)
+    return (daily, )
+
+
+def _map_chunks(func, raw_dir, codes, year, workers):
+    chunks = [(raw_dir, codes[start:start + CHUNK_SIZE], year)
+              for start in range(0, len(codes), CHUNK_SIZE)]
+    if workers == 1:
+        results = list(map(func, chunks))
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(func, chunks))
+    return tuple(np.concatenate(parts, axis=1) for parts in zip(*results))
+
+
+def aggregate_stations(raw_dir, codes, year, workers=None):
+    """
+    Aggregate data for all stations in parallel processes.
+
+    :param raw_dir: directory with raw daily data
+    :param codes: station codes
+    :param year: year for monthly and daily values of the last year
+    :param workers: number of processes; all cores by default
+    :return: a tuple of arrays as in `aggregate_station`, but with stations
+        in the second dimension
+    """
+    check_year(year)
+    return _map_chunks(_aggregate_chunk, raw_dir, codes, year, workers)
+
+
+def daily_stations(raw_dir, codes, year, workers=None):
+    """
+    Return daily values for all stations for the given year, computed in
+    parallel processes.
+
+    :return: array of shape (len(PROPS), len(codes), 365 or 366)
+    """
+    return _map_chunks(_daily_chunk, raw_dir, codes, year, workers)[0]
+
+
+def read_fixed_width(path, fields):
+    """Read a fixed-width file into a list of tuples of stripped strings."""
+    with open(path, encoding="latin-1") as f:
+        return [tuple(line[start:end].strip() for start, end in fields)
+                for line in f if line.strip()]
+
+
+def station_table(stations_path, countries_path, continents_path=None):
+    """
+    Construct a table with station data from GHCN-Daily metadata files.
+
+    :param stations_path: path to ghcnd-stations.txt
+    :param countries_path: path to ghcnd-countries.txt
+    :param continents_path: optional CSV with columns country, continent
+        and region
+    :return: Table
+    """
+    countries = dict(read_fixed_width(countries_path, ((0, 2), (3, None))))
+    continents = {}
+    if continents_path is not None:
+        with open(continents_path, newline="", encoding="utf-8") as f:
+            for country, continent, region, *_ in csv.reader(f):
+                continents[country] = (continent, region)
+
+    rows = read_fixed_width(
+        stations_path,
+        ((0, 11), (12, 20), (21, 30), (31, 37), (38, 40), (41, 71)))
+    codes, lats, lons, elevs, states, names = zip(*rows)
+    country_names = [countries.get(code[:2], "") for code in codes]
+    cont_regs = [continents.get(country, ("", ""))
+                 for country in country_names]
+    cont_values = sorted({cont for cont, _ in cont_regs} - {""})
+    reg_values = sorted({reg for _, reg in cont_regs} - {""})
+
+    domain = Domain([], None, [
+        StringVariable("Code"), StringVariable("Station"),
+        StringVariable("Country"),
+        DiscreteVariable("Continent", values=cont_values),
+        DiscreteVariable("Region", values=reg_values),
+        ContinuousVariable("Latitude"), ContinuousVariable("Longitude"),
+        ContinuousVariable("Elevation")])
+    metas = np.array([
+        (code,
+         f"{name}, {state + ' ' if state else ''}{code[:2]}",
+         country,
+         cont_values.index(cont) if cont else np.nan,
+         reg_values.index(reg) if reg else np.nan,
+         float(lat), float(lon), float(elev))
+        for code, name, state, country, (cont, reg), lat, lon, elev
+        in zip(codes, names, states, country_names, cont_regs,
+               lats, lons, elevs)], dtype=object)
+    return Table.from_numpy(domain, np.empty((len(metas), 0)), metas=metas)
+
+
+def countries_array(station_data):
+    """
+    Return an array with names of countries and their continents, and
+    country index for each station (-1 for stations without a country).
+    """
+    country_col = station_data.get_column("Country")
+    cont_var = station_data.domain["Continent"]
+    cont_col = station_data.get_column(cont_var)
+    names = sorted(set(country_col) - {""})
+    positions = {name: i for i, name in enumerate(names)}
+    codes = np.array([positions.get(name, -1) for name in country_col])
+    continents = []
+    for i in range(len(names)):
+        conts = cont_col[(codes == i) & np.isfinite(cont_col)].astype(int)
+        continents.append(
+            cont_var.values[np.bincount(conts).argmax()] if len(conts)
+            else "")
+    return np.array(list(zip(names, continents))), codes
+
+
+def build(raw_dir, out_dir=None, year=None, workers=None, fmt="auto",
+          station_data=None):
+    """
+    Build all datasets from raw data.
+
+    :param raw_dir: directory with raw daily data
+    :param out_dir: output directory; `DATA_DIR` by default
+    :param year: year for monthly and daily values of the last year;
+        the last complete year by default; it must be within the years
+        for which monthly values are stored (see `check_year`)
+    :param workers: number of processes; all cores by default
+    :param fmt: format of arrays (see `convert.save`)
+    :param station_data: table with stations; if `None`, stations are read
+        from `station-data.pkl.gz` in the output directory
+    :return: names of written arrays
+    """
+    out_dir = out_dir or DATA_DIR
+    if year is None:
+        year = datetime.date.today().year - 1
+    check_year(year)
+    data_path = os.path.join(out_dir, "station-data.pkl.gz")
+    if station_data is None:
+        station_data = Table(data_path)
+    codes = list(station_data.get_column("Code"))
+    check_partitions(out_dir, codes, year)
+
+    total, by_decades, last_year, daily = \
+        aggregate_stations(raw_dir, codes, year, workers)
+    countries, country_codes = countries_array(station_data)
+
+    written = []
+
+    def write(name, arr):
+        save(name, arr, out_dir, fmt)
+        written.append(name)
+
+    for infix, arrs in (("MT", total), ("MD", by_decades),
+                        (f"M{year}", last_year)):
+        for prop, arr in zip(PROPS, arrs):
+            write(f"S-{infix}-{prop}", arr)
+            write(f"C-{infix}-{prop}",
+                  group_reduce(arr, country_codes, len(countries)))
+    write(monthly_prefix(year) + "stations", stations_digest(codes))
+    write_daily(write, daily, year, codes)
+    write("countries", countries)
+    written += derive(out_dir, fmt, written_prefixes(written))
+    # Stations are written last, so that an interrupted build does not
+    # leave a table whose rows do not match the existing arrays
+    save_station_data(station_data, data_path)
+    return written
+
+
+def save_station_data(station_data, path):
+    """Pickle the table with stations; write to a temporary file first."""
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wb") as f:
+        pickle.dump(station_data, f)
+    os.replace(tmp_path, path)
+
+
+def build_daily(raw_dir, out_dir=None, year=None, workers=None, fmt="auto"):
+    """
+    Add daily values for the given year to existing data.
+
+    Rows are aligned with `station-data.pkl.gz` in the output directory.
+    Arrays for other years are not rewritten, so stations must be the same
+    as when they were built.
+
+    :param raw_dir: directory with raw daily data
+    :param out_dir: output directory; `DATA_DIR` by default
+    :param year: year of daily values; the last complete year by default
+    :param workers: number of processes; all cores by default
+    :param fmt: format of arrays (see `convert.save`)
+    :return: names of written arrays
+    """
+    out_dir = out_dir or DATA_DIR
+    if year is None:
+        year = datetime.date.today().year - 1
+    station_data = Table(os.path.join(out_dir, "station-data.pkl.gz"))
+    codes = list(station_data.get_column("Code"))
+    check_partitions(out_dir, codes, year)
+    daily = daily_stations(raw_dir, codes, year, workers)
+
+    written = []
+
+    def write(name, arr):
+        save(name, arr, out_dir, fmt)
+        written.append(name)
+
+    write_daily(write, daily, year, codes)
+    return written + derive(out_dir, fmt, written_prefixes(written))
+
+
+def check_partitions(out_dir, codes, year):
+    """
+    Raise `ValueError` if partitions with daily values or monthly values
+    for years other than `year` (which are rewritten) were built for other
+    stations.
+    """
+    prefixes = [prefix
+                for part_year, prefix in daily_partitions(out_dir).items()
+                if part_year != year]
+    prefixes += [monthly_prefix(part_year)
+                 for part_year in monthly_years(out_dir) if part_year != year]
+    stale = [prefix for prefix in prefixes
+             if not partition_matches(prefix, codes, out_dir)]
+    if stale:
+        raise ValueError(
+            f"Values {', '.join(stale)} were built for other stations; "
+            "rebuild them for the same stations or remove them")
+
+
+def write_daily(write, daily, year, codes):
+    """
+    Write a partition with daily values for the year, a mask of stations
+    with any daily values, and a digest of station codes.
+    """
+    prefix = daily_prefix(year)
+    for prop, arr in zip(PROPS, daily):
+        write(prefix + prop, arr)
+    write(prefix + "mask", np.any(np.isfinite(daily), axis=(0, 2)))
+    write(prefix + "stations", stations_digest(codes))
+
+
+def written_prefixes(names):
+    """Return sorted prefixes of array names, e.g. "S-MT-"."""
+    return sorted({name.rsplit("-", 1)[0] + "-"
+                   for name in names if name.startswith(("S-", "C-"))})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Build weather datasets from raw daily station data")
+    parser.add_argument("raw_dir", metavar="RAW_DIR",
+                        help="directory with <station code>.csv or .dly files")
+    parser.add_argument("-o", "--out-dir", default=DATA_DIR,
+                        help="output directory")
+    parser.add_argument("--year", type=int,
+                        help="year for last year's values "
+                             "(default: last complete year)")
+    parser.add_argument("--daily-only", action="store_true",
+                        help="only add daily values for the year to "
+                             "existing data")
+    parser.add_argument("-j", "--workers", type=int,
+                        help="number of worker processes (default: all cores)")
+    parser.add_argument("-f", "--format", default="auto",
+                        choices=("auto", "npy", "enc", "blocks"),
+                        help="output format (default: blocks for large "
+                             "arrays, enc for others)")
+    parser.add_argument("--stations",
+                        help="ghcnd-stations.txt; if omitted, stations are "
+                             "read from existing station-data.pkl.gz")
+    parser.add_argument("--countries", help="ghcnd-countries.txt")
+    parser.add_argument("--continents",
+                        help="CSV with columns country, continent, region")
+    args = parser.parse_args(argv)
+
+    if args.daily_only:
+        for name in build_daily(args.raw_dir, args.out_dir, args.year,
+                                args.workers, args.format):
+            print(name)
+        return
+
+    if args.year is not None:
+        try:
+            check_year(args.year)
+        except ValueError as ex:
+            parser.error(str(ex))
+    station_data = None
+    if args.stations:
+        if not args.countries:
+            parser.error("--stations requires --countries")
+        station_data = station_table(
+            args.stations, args.countries, args.continents)
+    for name in build(args.raw_dir, args.out_dir, args.year, args.workers,
+                      args.format, station_data):
+        print(name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+A size-bounded least-recently-used cache for decoded arrays.
+
+A single instance, `store.array_cache`, is shared by all widgets, so that
+changing a setting in one of them (or in another widget on the canvas) costs
+only indexing of an already decoded array instead of decompressing a file.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def nbytes(value):
+    """
+    Return the memory occupied by `value`.
+
+    Memory-mapped arrays are counted as empty since their pages are owned
+    and evicted by the operating system.
+    """
+    if isinstance(value, np.memmap):
+        return 0
+    return getattr(value, "nbytes", 0)
+
+
+class ArrayCache:
+    """
+    LRU cache with a memory budget.
+
+    Values are computed by a function passed to `get`. If adding a value
+    exceeds the budget, the least recently used values are evicted. Values
+    larger than the budget are returned, but not stored.
+
+    The cache is thread-safe. Values are computed outside the lock; if two
+    threads request the same missing key, the value may be computed twice.
+
+    Attributes:
+        max_bytes (int): memory budget
+        hits (int): number of lookups that found the value in cache
+        misses (int): number of lookups that had to compute the value
+    """
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes):
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict()
+
+    @property
+    def nbytes(self):
+        """Memory used by cached values"""
+        return sum(self._sizes.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, compute):
+        """
+        Return the value for `key`, calling `compute()` if it is not cached.
+        """
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+        value = compute()
+        size = nbytes(value)
+        with self._lock:
+            if size <= self._max_bytes and key not in self._entries:
+                self._entries[key] = value
+                self._sizes[key] = size
+                self._evict()
+        return value
+
+    def clear(self):
+        """Remove all values and reset counters."""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.hits = self.misses = 0
+
+    def _evict(self):
+        total = sum(self._sizes.values())
+        while total > self._max_bytes:
+            key, _ = self._entries.popitem(last=False)
+            total -= self._sizes.pop(key)
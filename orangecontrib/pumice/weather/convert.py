@@ -0,0 +1,192 @@
+"""
+Convert gzipped pickles with weather data into formats with random access.
+
+Files `.npy` and `.enc` are memory-mapped by `store.load_array`, so a query
+for a few stations reads only the corresponding rows instead of decompressing
+the entire file. Large arrays (monthly data by decades and daily data) are
+by default stored in `.blocks` containers, which are compressed by blocks
+of stations; a query decompresses only the blocks it needs.
+
+In formats `.enc` and `.blocks`, arrays of floats are encoded as int16 at
+the resolution given in `RESOLUTION`, or as float32 if their range is too
+large (see `encoding.py`). Format `npy` stores exact values.
+
+Usage:
+
+    python -m orangecontrib.pumice.weather.convert [-d DATA_DIR] [--remove]
+                                                    [-f {auto,npy,enc,blocks}]
+                                                    [NAME ...]
+
+Without names, all `*.pkl.gz` files in the data directory are converted,
+except for `station-data` which is an Orange Table and stays as it is.
+
+Afterwards, derived arrays (e.g. temperature span, "*-tspan") are computed
+for all prefixes whose source arrays exist, and saved in the same way.
+"""
+import os
+import glob
+import argparse
+
+import numpy as np
+
+from orangecontrib.pumice.weather.blocks import write_blocks
+from orangecontrib.pumice.weather.encoding import Encoding, write_encoded
+from orangecontrib.pumice.weather.store import (
+    DATA_DIR, DERIVED, FORMATS, array_path, load_pickle, load_array,
+    has_array, compute_derived, split_name)
+
+# Files that are not plain numeric or string arrays
+SKIP = {"station-data"}
+
+# Prefixes of arrays that are stored in blocks in format "auto"
+BLOCK_PREFIXES = ("S-MD-", "S-Y")
+
+# Resolution of encoded values, by property; temperatures are in degrees
+# and precipitation in millimeters, except for daily temperatures ("S-Y"),
+# which are in tenths of degrees; daily averages that the build computes from
+# extremes (see `build.add_daily_averages`) are in halves of tenths
+RESOLUTION = {"tavg": 0.01, "tmin": 0.01, "tmax": 0.01, "tspan": 0.01,
+              "prcp": 0.1}
+DAILY_RESOLUTION = {"tavg": 0.5, "tmin": 1, "tmax": 1, "tspan": 0.5,
+                    "prcp": 0.1}
+
+
+def pickled_names(data_dir=None):
+    """Return names of all arrays stored as gzipped pickles."""
+    paths = glob.glob(array_path("*", ".pkl.gz", data_dir))
+    names = (os.path.basename(path)[:-len(".pkl.gz")] for path in paths)
+    return sorted(name for name in names if name not in SKIP)
+
+
+def save_npy(name, arr, data_dir=None):
+    """Save array `name` as `.npy`; write to a temporary file first."""
+    path = array_path(name, ".npy", data_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(arr), allow_pickle=False)
+    os.replace(tmp_path, path)
+
+
+def encoding_for(name, arr):
+    """
+    Return encoding for array `name`, or `None` for arrays that are not
+    floats.
+    """
+    if arr.dtype.kind != "f":
+        return None
+    prefix, prop = split_name(name)
+    resolutions = DAILY_RESOLUTION if prefix.startswith("S-Y") else RESOLUTION
+    return Encoding.for_array(arr, resolutions.get(prop))
+
+
+def save(name, arr, data_dir=None, fmt="auto"):
+    """
+    Save array `name` as `.npy`, `.enc` or `.blocks`, and remove files in
+    other formats, if they exist, so they don't shadow the new one.
+
+    Arrays that are not floats are saved as `.npy` instead of `.enc`, and
+    without encoding in `.blocks`.
+
+    :param name: array name
+    :param arr: array
+    :param data_dir: directory with data; `DATA_DIR` by default
+    :param fmt: "npy", "enc", "blocks", or "auto" to use blocks for arrays
+        whose names start with one of `BLOCK_PREFIXES`, except for vectors,
+        and "enc" for others
+    """
+    arr = np.asarray(arr)
+    if fmt == "auto":
+        fmt = "blocks" if name.startswith(BLOCK_PREFIXES) and arr.ndim > 1 \
+            else "enc"
+    encoding = None if fmt == "npy" else encoding_for(name, arr)
+    if fmt == "blocks":
+        ext = ".blocks"
+        write_blocks(array_path(name, ext, data_dir), arr, encoding=encoding)
+    elif encoding is not None:
+        ext = ".enc"
+        write_encoded(array_path(name, ext, data_dir), arr, encoding)
+    else:
+        ext = ".npy"
+        save_npy(name, arr, data_dir)
+    for other in FORMATS:
+        path = array_path(name, other, data_dir)
+        if other not in (ext, ".pkl.gz") and os.path.exists(path):
+            os.remove(path)
+
+
+def convert(names=None, data_dir=None, remove=False, fmt="auto"):
+    """
+    Convert arrays from gzipped pickles to `.npy` or `.blocks`.
+
+    Arrays of objects cannot be memory-mapped and are skipped.
+
+    :param names: names of arrays; all pickled arrays by default
+    :param data_dir: directory with data; `DATA_DIR` by default
+    :param remove: if `True`, pickles are removed after conversion
+    :param fmt: format; see `save`
+    :return: names of converted arrays
+    """
+    converted = []
+    for name in names or pickled_names(data_dir):
+        arr = load_pickle(name, data_dir)
+        if not isinstance(arr, np.ndarray) or arr.dtype == object:
+            continue
+        save(name, arr, data_dir, fmt)
+        if remove:
+            os.remove(array_path(name, ".pkl.gz", data_dir))
+        converted.append(name)
+    return converted
+
+
+def array_prefixes(data_dir=None):
+    """Return prefixes (e.g. "S-MT-") of all stored arrays."""
+    paths = glob.glob(array_path("[SC]-*", "", data_dir))
+    paths = [path for path in paths if not path.endswith(".tmp")]
+    return sorted({os.path.basename(path).rsplit("-", 1)[0] + "-"
+                   for path in paths})
+
+
+def derive(data_dir=None, fmt="auto", prefixes=None):
+    """
+    Compute and save derived arrays that can be computed from stored arrays.
+
+    :param data_dir: directory with data; `DATA_DIR` by default
+    :param fmt: format; see `save`
+    :param prefixes: prefixes of arrays (e.g. "S-Y2024-"); all by default
+    :return: names of saved arrays
+    """
+    saved = []
+    for prefix in prefixes or array_prefixes(data_dir):
+        for prop, (sources, _) in DERIVED.items():
+            if not all(has_array(prefix + source, data_dir)
+                       for source in sources):
+                continue
+            name = prefix + prop
+            arr = compute_derived(
+                name, lambda source: load_array(source, data_dir))
+            save(name, arr, data_dir, fmt)
+            saved.append(name)
+    return saved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert pickled weather data to files with random access")
+    parser.add_argument("names", nargs="*", metavar="NAME",
+                        help="arrays to convert (default: all)")
+    parser.add_argument("-d", "--data-dir", default=DATA_DIR,
+                        help="directory with data")
+    parser.add_argument("--remove", action="store_true",
+                        help="remove pickles after conversion")
+    parser.add_argument("-f", "--format", default="auto",
+                        choices=("auto", "npy", "enc", "blocks"),
+                        help="output format (default: blocks for large "
+                             "arrays, enc for others)")
+    args = parser.parse_args(argv)
+    for name in convert(args.names, args.data_dir, args.remove, args.format) \
+            + derive(args.data_dir, args.format):
+        print(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Compact storage of floating point arrays.
+
+Values are stored as int16, `raw = round((value - offset) / scale)`, where
+scale is the resolution at which the values are needed, e.g. 0.01 degree,
+and the offset is the middle of the range of values. Missing values (nan)
+are stored as `SENTINEL`. Arrays whose range cannot be represented with
+int16 at the required resolution are stored as float32. Decoded values are
+float32.
+
+Encoded arrays are stored either in block containers (see `blocks.py`), or
+in uncompressed `.enc` files, which are memory-mapped. An `.enc` file starts
+with a magic string and the length of a JSON header with the shape and
+encoding of the array, followed by raw data, aligned to `ALIGNMENT` bytes.
+
+`EncodedArray` decodes only the rows that are selected by indexing.
+"""
+import os
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b"PMCENC01"
+_LENGTH = struct.Struct("<Q")
+
+# Alignment of data in `.enc` files
+ALIGNMENT = 64
+
+# Type of decoded values
+DECODED = np.dtype(np.float32)
+
+# Raw value for missing data in int16 encoding
+SENTINEL = np.iinfo(np.int16).min
+_MAX_RAW = np.iinfo(np.int16).max
+
+
+class Encoding:
+    """
+    Mapping between stored (raw) and decoded values.
+
+    Attributes:
+        dtype (np.dtype): type of stored values
+        scale (float): difference between decoded values of consecutive
+            raw values
+        offset (float): decoded value of raw value 0
+        sentinel (int or None): raw value for nan; `None` for float types,
+            which represent nan themselves
+    """
+    def __init__(self, dtype, scale=1.0, offset=0.0, sentinel=None):
+        self.dtype = np.dtype(dtype)
+        self.scale = scale
+        self.offset = offset
+        self.sentinel = sentinel
+
+    def __eq__(self, other):
+        return isinstance(other, Encoding) \
+            and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"Encoding({self.dtype}, scale={self.scale}, " \
+               f"offset={self.offset}, sentinel={self.sentinel})"
+
+    @classmethod
+    def for_array(cls, arr, resolution=None):
+        """
+        Return int16 encoding for `arr` at the given resolution, if it fits
+        into the range of int16, and float32 otherwise.
+
+        :param arr: array of floats
+        :param resolution: required resolution; None for float32
+        :return: Encoding
+        """
+        arr = np.asarray(arr)
+        if resolution is None or np.isinf(arr).any():
+            return cls(DECODED)
+        finite = arr[np.isfinite(arr)]
+        lo, hi = (finite.min(), finite.max()) if finite.size else (0, 0)
+        offset = float(np.round((lo + hi) / 2 / resolution) * resolution)
+        if max(hi - offset, offset - lo) / resolution > _MAX_RAW - 0.5:
+            return cls(DECODED)
+        return cls(np.int16, resolution, offset, int(SENTINEL))
+
+    def encode(self, arr):
+        """Return raw values for array `arr`."""
+        arr = np.asarray(arr)
+        if self.sentinel is None:
+            return arr.astype(self.dtype)
+        raw = np.round((arr - self.offset) / self.scale)
+        raw[np.isnan(raw)] = self.sentinel
+        return raw.astype(self.dtype)
+
+    def decode(self, raw):
+        """Return a new array of floats with values for raw values `raw`."""
+        if self.sentinel is None:
+            return np.array(raw, dtype=DECODED)
+        raw = np.asarray(raw)
+        return np.where(
+            raw == self.sentinel, DECODED.type(np.nan),
+            raw * DECODED.type(self.scale) + DECODED.type(self.offset))
+
+    def to_dict(self):
+        return dict(dtype=self.dtype.str, scale=self.scale,
+                    offset=self.offset, sentinel=self.sentinel)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+
+class EncodedArray:
+    """
+    Read-only array of encoded values, which are decoded on indexing.
+
+    Indexing selects raw values from the underlying array (e.g. a memory-
+    mapped array or `BlockArray`) and decodes only those.
+
+    Attributes:
+        raw (np.ndarray or BlockArray): stored values
+        encoding (Encoding): encoding of values
+    """
+    def __init__(self, raw, encoding):
+        self.raw = raw
+        self.encoding = encoding
+
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def dtype(self):
+        return DECODED
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self.encoding.decode(self.raw[...])
+        return arr if dtype is None else arr.astype(dtype)
+
+    def __getitem__(self, key):
+        return self.encoding.decode(self.raw[key])
+
+
+def write_encoded(path, arr, encoding):
+    """
+    Encode array `arr` and write it into an `.enc` file at `path`.
+
+    The file is first written to a temporary file, which then replaces
+    the target.
+    """
+    raw = np.ascontiguousarray(encoding.encode(arr))
+    header = json.dumps(dict(shape=raw.shape, encoding=encoding.to_dict()))
+    header = header.encode("ascii")
+    start = len(MAGIC) + _LENGTH.size + len(header)
+    header += b" " * (-start % ALIGNMENT)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(len(header)))
+        f.write(header)
+        f.write(raw.data)
+    os.replace(tmp_path, path)
+
+
+def load_encoded(path):
+    """Return `EncodedArray` with memory-mapped data from an `.enc` file."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an encoded array")
+        length, = _LENGTH.unpack(f.read(_LENGTH.size))
+        header = json.loads(f.read(length))
+        data_start = f.tell()
+    encoding = Encoding.from_dict(header["encoding"])
+    shape = tuple(header["shape"])
+    if 0 in shape:
+        raw = np.empty(shape, dtype=encoding.dtype)
+    else:
+        raw = np.memmap(path, dtype=encoding.dtype, mode="r",
+                        offset=data_start, shape=shape)
+    return EncodedArray(raw, encoding)
@@ -0,0 +1,249 @@
+"""
+Spatial indices of weather stations.
+
+`SpatialIndex` answers nearest-station and radius queries. Stations are
+represented as points on a unit sphere, which are stored in a KD-tree.
+The Euclidean (chord) distance between two points is a monotonic function
+of the great-circle distance, so k nearest points in the tree are the k
+nearest stations, and a radius on the Earth's surface translates into
+a chord length.
+
+`GridIndex` answers queries for bounding boxes and polygons. Stations are
+sorted by cells of a latitude/longitude grid, so that candidates for a
+query are gathered from the cells that overlap the query's bounding box,
+and then refined with a vectorized test.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Mean Earth radius in km
+EARTH_RADIUS = 6371.0
+
+
+def unit_vectors(latitudes, longitudes):
+    """Return points on a unit sphere for coordinates in degrees."""
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack(
+        (cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def chord_to_km(chord):
+    """Return the great-circle distance for the chord on a unit sphere."""
+    return 2 * EARTH_RADIUS * np.arcsin(np.minimum(chord, 2) / 2)
+
+
+def km_to_chord(km):
+    """Return the chord on a unit sphere for the great-circle distance."""
+    return 2 * np.sin(np.minimum(km / EARTH_RADIUS, np.pi) / 2)
+
+
+def wrap_longitudes(longitudes):
+    """Return longitudes in range [-180, 180)."""
+    return (np.asarray(longitudes, dtype=float) + 180) % 360 - 180
+
+
+def coordinates(data):
+    """
+    Return arrays with latitudes and longitudes of points (e.g. stations)
+    in `data`.
+
+    Columns are found by names. Variables in the shipped station data have
+    broken names, so coordinates are taken from the first two continuous
+    variables (including metas) if names are not found.
+
+    Raises `ValueError` if data has no coordinates.
+    """
+    domain = data.domain
+    if "Latitude" in domain and "Longitude" in domain:
+        return data.get_column("Latitude"), data.get_column("Longitude")
+    variables = [var for var in domain.variables + domain.metas
+                 if var.is_continuous]
+    if len(variables) < 2:
+        raise ValueError("Data does not contain latitudes and longitudes")
+    lat, lon = variables[:2]
+    return data.get_column(lat), data.get_column(lon)
+
+
+def points_in_polygon(x, y, poly_x, poly_y):
+    """
+    Return a boolean array that tells which points lie in the polygon.
+
+    The test uses the even-odd rule: it counts the polygon's edges that are
+    crossed by a ray from the point. It is vectorized over points and
+    loops over edges.
+
+    :param x: x coordinates of points
+    :param y: y coordinates of points
+    :param poly_x: x coordinates of polygon's vertices
+    :param poly_y: y coordinates of polygon's vertices
+    :return: np.ndarray of bool
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    inside = np.zeros(len(x), dtype=bool)
+    for x0, y0, x1, y1 in zip(poly_x, poly_y,
+                              np.roll(poly_x, -1), np.roll(poly_y, -1)):
+        if y0 == y1:
+            continue
+        crosses = (y0 > y) != (y1 > y)
+        inside ^= crosses & (x < x0 + (y - y0) * (x1 - x0) / (y1 - y0))
+    return inside
+
+
+class SpatialIndex:
+    """
+    Index of points given by latitudes and longitudes (in degrees).
+
+    Points with unknown coordinates are not included. Queries return
+    indices of points in the original arrays, sorted by distance, and
+    distances in km.
+    """
+    def __init__(self, latitudes, longitudes):
+        points = unit_vectors(latitudes, longitudes)
+        self._rows = np.flatnonzero(np.isfinite(points).all(axis=1))
+        self._tree = cKDTree(points[self._rows])
+
+    def __len__(self):
+        return len(self._rows)
+
+    def nearest(self, latitude, longitude, k=1, radius=None):
+        """
+        Return up to `k` points nearest to the given location, optionally
+        within `radius` km.
+
+        :param latitude: latitude of location (degrees)
+        :param longitude: longitude of location (degrees)
+        :param k: maximal number of points
+        :param radius: maximal distance in km (optional)
+        :return: indices of points and distances (in km)
+        """
+        k = min(k, len(self))
+        if k == 0:
+            return np.empty(0, dtype=int), np.empty(0)
+        bound = np.inf if radius is None else km_to_chord(radius)
+        point = unit_vectors([latitude], [longitude])[0]
+        chords, indices = self._tree.query(
+            point, k=[*range(1, k + 1)], distance_upper_bound=bound)
+        # Missing neighbours within the bound have infinite distance
+        found = np.isfinite(chords)
+        return self._rows[indices[found]], chord_to_km(chords[found])
+
+    def within(self, latitude, longitude, radius):
+        """
+        Return all points within `radius` km of the given location.
+
+        :param latitude: latitude of location (degrees)
+        :param longitude: longitude of location (degrees)
+        :param radius: distance in km
+        :return: indices of points and distances (in km), sorted by distance
+        """
+        point = unit_vectors([latitude], [longitude])[0]
+        indices = np.array(
+            self._tree.query_ball_point(point, km_to_chord(radius)),
+            dtype=int)
+        chords = np.linalg.norm(self._tree.data[indices] - point, axis=1)
+        order = np.argsort(chords, kind="stable")
+        return self._rows[indices[order]], chord_to_km(chords[order])
+
+
+class GridIndex:
+    """
+    Index of points given by latitudes and longitudes (in degrees), for
+    queries by bounding boxes and polygons.
+
+    Points are sorted by cells of a grid, row by row, so points in
+    consecutive cells of a row of the grid are contiguous; a query gathers
+    one slice of points per row of the grid that overlaps the query.
+    Points with unknown coordinates are not included. Queries return sorted
+    indices of points in the original arrays.
+
+    Attributes:
+        cell (float): size of a cell in degrees
+    """
+    def __init__(self, latitudes, longitudes, cell=1.0):
+        lat = np.asarray(latitudes, dtype=float)
+        lon = wrap_longitudes(longitudes)
+        rows = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        self.cell = cell
+        self._nlat = int(np.ceil(180 / cell))
+        self._nlon = int(np.ceil(360 / cell))
+        cells = self._lat_cells(lat[rows]) * self._nlon \
+            + self._lon_cells(lon[rows])
+        order = np.argsort(cells, kind="stable")
+        self._rows = rows[order]
+        self._lat = lat[self._rows]
+        self._lon = lon[self._rows]
+        self._bounds = np.zeros(self._nlat * self._nlon + 1, dtype=int)
+        np.cumsum(np.bincount(cells, minlength=self._nlat * self._nlon),
+                  out=self._bounds[1:])
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _lat_cells(self, lat):
+        return np.clip(np.floor((np.asarray(lat) + 90) / self.cell),
+                       0, self._nlat - 1).astype(int)
+
+    def _lon_cells(self, lon):
+        return np.clip(np.floor((np.asarray(lon) + 180) / self.cell),
+                       0, self._nlon - 1).astype(int)
+
+    def _candidates(self, south, west, north, east):
+        """
+        Return positions (in sorted arrays) of points in cells that overlap
+        the box; west must not be greater than east.
+        """
+        lat_rows = np.arange(self._lat_cells(south), self._lat_cells(north) + 1)
+        starts = self._bounds[lat_rows * self._nlon + self._lon_cells(west)]
+        ends = self._bounds[lat_rows * self._nlon + self._lon_cells(east) + 1]
+        if not len(starts):
+            return np.empty(0, dtype=int)
+        return np.concatenate(
+            [np.arange(start, end) for start, end in zip(starts, ends)])
+
+    def _in_box(self, south, west, north, east):
+        """Return positions of points in the box; west <= east."""
+        cand = self._candidates(south, west, north, east)
+        lat, lon = self._lat[cand], self._lon[cand]
+        return cand[(lat >= south) & (lat <= north)
+                    & (lon >= west) & (lon <= east)]
+
+    def in_box(self, south, west, north, east):
+        """
+        Return indices of points within the bounding box.
+
+        The box spans from `west` eastwards to `east`; if `west` is greater
+        than `east`, the box crosses the antimeridian.
+
+        :return: sorted indices of points
+        """
+        width = (east - west) % 360
+        if east - west >= 360 or width == 0 and east != west:
+            west, width = -180, 360
+        west = float(wrap_longitudes(west))
+        east = west + width
+        if east <= 180:
+            positions = self._in_box(south, west, north, east)
+        else:
+            positions = np.concatenate((
+                self._in_box(south, west, north, 180),
+                self._in_box(south, -180, north, east - 360)))
+        return np.sort(self._rows[positions])
+
+    def in_polygon(self, latitudes, longitudes):
+        """
+        Return indices of points within the polygon with the given vertices.
+
+        Longitudes of vertices are not wrapped, so polygons must not cross
+        the antimeridian.
+
+        :return: sorted indices of points
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        cand = self._in_box(latitudes.min(), max(longitudes.min(), -180),
+                            latitudes.max(), min(longitudes.max(), 180))
+        inside = points_in_polygon(self._lon[cand], self._lat[cand],
+                                   longitudes, latitudes)
+        return np.sort(self._rows[cand[inside]])
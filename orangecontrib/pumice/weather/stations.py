@@ -0,0 +1,111 @@
+"""
+Index of weather stations for fast lookups by name, code and country.
+"""
+import numpy as np
+
+from Orange.data import Table
+
+
+class _Groups:
+    """
+    Map from values in a column to indices of rows with that value.
+
+    Rows are kept in a single array, sorted by values, so the index takes
+    about as much memory as the column itself.
+    """
+    def __init__(self, column):
+        values, inverse = np.unique(column, return_inverse=True)
+        self.values = values
+        self.codes = inverse.reshape(-1)
+        self._order = np.argsort(self.codes, kind="stable")
+        self._bounds = np.zeros(len(values) + 1, dtype=int)
+        np.cumsum(np.bincount(self.codes, minlength=len(values)),
+                  out=self._bounds[1:])
+        self._positions = {value: i for i, value in enumerate(values)}
+
+    def code(self, value):
+        """Return the code of the value, or -1 if it does not exist."""
+        return self._positions.get(value, -1)
+
+    def rows(self, value):
+        """Return (sorted) indices of rows with the given value."""
+        code = self.code(value)
+        if code == -1:
+            return np.empty(0, dtype=int)
+        return self._order[self._bounds[code]:self._bounds[code + 1]]
+
+    def rows_for(self, values):
+        """
+        Return sorted indices of rows with any of the given values, and the
+        number of values that were found.
+        """
+        codes = [code for code in map(self.code, set(values)) if code != -1]
+        if not codes:
+            return np.empty(0, dtype=int), 0
+        rows = np.concatenate(
+            [self._order[self._bounds[code]:self._bounds[code + 1]]
+             for code in codes])
+        rows.sort()
+        return rows, len(codes)
+
+
+class StationIndex:
+    """
+    Index of stations built from station data (see README in datasets).
+
+    Station names, codes and countries are mapped to rows, so lookups take
+    time proportional to the number of looked-up values, not to the number
+    of stations.
+
+    Attributes:
+        countries (np.ndarray): sorted names of countries
+        continents (np.ndarray): names of continents; "" for unknown
+        country_codes (np.ndarray of int): for each station, the index of its
+            country in `countries`
+        continent_codes (np.ndarray of int): for each station, the index of
+            its continent in `continents`
+    """
+    def __init__(self, data: Table):
+        self._names = _Groups(data.get_column("Station"))
+        self._codes = _Groups(data.get_column("Code"))
+        self._countries = _Groups(data.get_column("Country"))
+
+        continents = data.domain["Continent"]
+        cont_column = data.get_column(continents)
+        known = np.isfinite(cont_column)
+        self._continents = _Groups(
+            np.where(known, cont_column, -1).astype(int))
+
+        self.countries = self._countries.values
+        self.country_codes = self._countries.codes
+        # Continents are given as a discrete variable; decode its values
+        self.continents = np.array(
+            [continents.values[int(code)] if code >= 0 else ""
+             for code in self._continents.values])
+        self.continent_codes = self._continents.codes
+
+    def by_name(self, name):
+        """Return indices of stations with the given name."""
+        return self._names.rows(name)
+
+    def by_code(self, code):
+        """Return indices of stations with the given code."""
+        return self._codes.rows(code)
+
+    def by_country(self, country):
+        """Return indices of stations in the given country."""
+        return self._countries.rows(country)
+
+    def by_names(self, names):
+        """
+        Return sorted indices of stations with the given names, and the
+        number of names that were found.
+        """
+        return self._names.rows_for(names)
+
+    def by_codes(self, codes):
+        """
+        Return sorted indices of stations with the given codes, and the
+        number of codes that were found.
+        """
+        return self._codes.rows_for(codes)
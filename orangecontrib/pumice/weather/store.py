@@ -0,0 +1,224 @@
+"""
+Access to arrays with weather data.
+
+Arrays are named by their file name without an extension, e.g. "S-MT-tavg"
+or "C-MD-prcp" (see `datasets/weather/README.md`). Each array is stored either
+
+- as an uncompressed `.npy` file, which is memory-mapped, so that indexing
+  reads only the pages with the selected rows,
+- as an uncompressed `.enc` file with values encoded as int16 or float32
+  (see `encoding.py`), which is memory-mapped and decoded on indexing,
+- as a container of separately compressed blocks of rows (`.blocks`, see
+  `blocks.py`), of which indexing decompresses only the blocks with the
+  selected rows; values may be encoded as in `.enc`, or
+- as a gzipped pickle (`.pkl.gz`), which must be decompressed as a whole.
+
+The first available format in this order is used. Files `.npy`, `.enc` and
+`.blocks` are produced from pickles by `orangecontrib.pumice.weather.convert`.
+
+Widgets get arrays through `get_array`, which keeps decoded arrays in a cache
+shared by all widgets. Derived properties (see `DERIVED`), like temperature
+span, are read from files if they exist and computed otherwise.
+
+Daily values are partitioned by years: arrays of a year have prefix
+"S-Y<year>-" (see `daily_partitions`), so a new year is added without
+rewriting the existing ones. Each partition, as well as monthly values for a
+year ("S-M<year>-"), records the stations it was built for (see
+`partition_matches`).
+"""
+import os
+import glob
+import gzip
+import pickle
+import hashlib
+
+import numpy as np
+
+from orangecontrib.pumice.weather.blocks import BlockArray
+from orangecontrib.pumice.weather.cache import ArrayCache
+from orangecontrib.pumice.weather.encoding import EncodedArray, load_encoded
+
+DATA_DIR = os.path.normpath(
+    os.path.join(os.path.dirname(__file__), "..", "datasets", "weather"))
+
+# Memory budget for decoded arrays shared by all widgets; can be changed
+# by setting `array_cache.max_bytes`
+CACHE_BUDGET = 1024 * 2 ** 20
+
+array_cache = ArrayCache(CACHE_BUDGET)
+
+# File extensions in the order of preference
+FORMATS = (".npy", ".enc", ".blocks", ".pkl.gz")
+
+# Properties that are computed from other properties if they are not stored:
+# names of source properties and a function that computes the derived one
+DERIVED = {
+    "tspan": (("tmax", "tmin"), np.subtract),
+}
+
+# Daily values for 2024 were shipped without a year in names of arrays
+# ("S-Y-<prop>"); they are used if there is no partition for that year
+UNPARTITIONED_DAILY_YEAR = 2024
+
+
+def array_path(name, ext, data_dir=None):
+    """Return the path of the file with array `name` and extension `ext`."""
+    return os.path.join(data_dir or DATA_DIR, name + ext)
+
+
+def load_pickle(name, data_dir=None):
+    """Load array `name` from a gzipped pickle."""
+    with gzip.open(array_path(name, ".pkl.gz", data_dir), "rb") as f:
+        return pickle.load(f)
+
+
+def load_array(name, data_dir=None):
+    """
+    Return array `name`; memory-mapped, if it is available as `.npy`,
+    a `BlockArray` if it is stored in blocks, or `EncodedArray` if
+    values are encoded.
+
+    Memory-mapped arrays, block arrays and encoded arrays are read-only.
+
+    :param name: array name, e.g. "S-MT-tavg"
+    :param data_dir: directory with data; `DATA_DIR` by default
+    :return: np.ndarray, np.memmap, BlockArray or EncodedArray
+    """
+    path = array_path(name, ".npy", data_dir)
+    if os.path.exists(path):
+        return np.load(path, mmap_mode="r")
+    path = array_path(name, ".enc", data_dir)
+    if os.path.exists(path):
+        return load_encoded(path)
+    path = array_path(name, ".blocks", data_dir)
+    if os.path.exists(path):
+        arr = BlockArray(path)
+        return arr if arr.encoding is None else EncodedArray(arr, arr.encoding)
+    return load_pickle(name, data_dir)
+
+
+def split_name(name):
+    """Split array name into a prefix (e.g. "S-MT-") and a property."""
+    prefix, sep, prop = name.rpartition("-")
+    return prefix + sep, prop
+
+
+def is_derived(name):
+    """Tell whether array `name` is a derived property."""
+    return split_name(name)[1] in DERIVED
+
+
+def compute_derived(name, load):
+    """
+    Compute array `name` for a derived property.
+
+    :param name: array name, e.g. "S-MT-tspan"
+    :param load: function that returns an array with the given name
+    :return: np.ndarray
+    """
+    prefix, prop = split_name(name)
+    sources, func = DERIVED[prop]
+    return func(*(load(prefix + source) for source in sources))
+
+
+def get_array(name):
+    """
+    Return array `name` from `DATA_DIR`, using the shared cache.
+
+    Derived arrays that are not stored are computed from their sources on
+    the first request, and kept in cache.
+
+    The result must not be modified since it may be shared with other
+    callers.
+    """
+    def compute():
+        if is_derived(name) and not has_array(name):
+            return compute_derived(name, get_array)
+        return load_array(name)
+
+    return array_cache.get(name, compute)
+
+
+def has_array(name, data_dir=None):
+    """Tell whether array `name` is available in any format."""
+    return any(os.path.exists(array_path(name, ext, data_dir))
+               for ext in FORMATS)
+
+
+def daily_prefix(year):
+    """Return the prefix of arrays with daily values for `year`."""
+    return f"S-Y{year}-"
+
+
+def monthly_prefix(year):
+    """Return the prefix of arrays with monthly values for `year`."""
+    return f"S-M{year}-"
+
+
+def daily_partitions(data_dir=None):
+    """
+    Return a dict with years for which daily values are stored and prefixes
+    of the corresponding arrays, e.g. `{2023: "S-Y2023-", 2024: "S-Y2024-"}`,
+    sorted by years.
+
+    A year is available if its mask (e.g. "S-Y2023-mask") is stored.
+    """
+    partitions = {}
+    for ext in FORMATS:
+        for path in glob.glob(array_path("S-Y*-mask", ext, data_dir)):
+            year = os.path.basename(path)[len("S-Y"):-len("-mask" + ext)]
+            if year.isdigit():
+                partitions[int(year)] = daily_prefix(year)
+    if UNPARTITIONED_DAILY_YEAR not in partitions \
+            and has_array("S-Y-mask", data_dir):
+        partitions[UNPARTITIONED_DAILY_YEAR] = "S-Y-"
+    return dict(sorted(partitions.items()))
+
+
+def stations_digest(codes):
+    """
+    Return a digest of station codes, as an array of bytes; it identifies
+    stations and the order of rows in arrays.
+    """
+    digest = hashlib.sha1("\n".join(codes).encode("utf-8")).digest()
+    return np.frombuffer(digest, dtype=np.uint8)
+
+
+def partition_matches(prefix, codes, data_dir=None):
+    """
+    Tell whether the daily partition or monthly values for a year with the
+    given prefix (e.g. "S-Y2024-" or "S-M2024-") have rows for stations
+    with the given codes, in the same order.
+
+    Arrays store a digest of codes (e.g. "S-Y2024-stations", see
+    `stations_digest`); for older arrays without it, only the number of
+    rows of the mask (for daily partitions) or of "tavg" is checked.
+    """
+    name = prefix + "stations"
+    if has_array(name, data_dir):
+        return np.array_equal(np.asarray(load_array(name, data_dir)[:]),
+                              stations_digest(codes))
+    name = prefix + "mask"
+    if not has_array(name, data_dir):
+        name = prefix + "tavg"
+    return len(load_array(name, data_dir)) == len(codes)
+
+
+def monthly_years(data_dir=None, codes=None):
+    """
+    Return sorted years for which monthly values of stations are stored
+    (e.g. "S-M2024-tavg").
+
+    If `codes` are given, years whose values were built for other stations
+    (see `partition_matches`) are skipped.
+    """
+    years = set()
+    for ext in FORMATS:
+        for path in glob.glob(array_path("S-M*-tavg", ext, data_dir)):
+            year = os.path.basename(path)[len("S-M"):-len("-tavg" + ext)]
+            if year.isdigit():
+                years.add(int(year))
+    if codes is not None:
+        years = {year for year in years
+                 if partition_matches(monthly_prefix(year), codes, data_dir)}
+    return sorted(years)
@@ -1,110 +1,445 @@
+import re
 import os.path
-import pickle
-import gzip
+import calendar
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, CancelledError, as_completed
+from functools import cache
 
 import numpy as np
 
+from AnyQt.QtCore import QTimer
 from AnyQt.QtWidgets import QSizePolicy
 
 from Orange.data import (
     Table, Domain, ContinuousVariable, StringVariable, DiscreteVariable)
 from Orange.widgets import gui
+from Orange.widgets.utils.concurrent import ConcurrentWidgetMixin, TaskState
 from Orange.widgets.widget import OWWidget
 from orangewidget.settings import Setting
 from orangewidget.utils.signals import Input, Output
 from orangewidget.utils.widgetpreview import WidgetPreview
 from orangewidget.widget import Msg
 
+from orangecontrib.pumice.weather.aggregate import (
+    REDUCTIONS, group_codes, group_counts, group_reduce, used_groups)
+from orangecontrib.pumice.weather.spatial import (
+    GridIndex, SpatialIndex, coordinates)
+from orangecontrib.pumice.weather.stations import StationIndex
+from orangecontrib.pumice.weather.store import (
+    DATA_DIR, DERIVED, array_cache, daily_partitions, get_array, has_array,
+    monthly_years, partition_matches, split_name)
+
 Months = ["January", "February", "March", "April", "May", "June",
           "July", "August", "September", "October", "November", "December"]
 
 MonthTempAttrs = [f"T-{month[:3]}" for month in Months]
 MonthPrecAttrs = [f"P-{month[:3]}" for month in Months]
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), "../datasets/weather")
-
-def dopen(s, mode="r"):
-    return gzip.open(os.path.join(DATA_DIR, s) + ".gz", mode)
-
-StationData = Table(os.path.join(DATA_DIR, "station-data.pkl.gz"))
-Countries = sorted(set(StationData.get_column("Country")) - {""})
-cont_values = StationData.domain["Continent"].values
-Continents = sorted(set(cont_values) - {"", "?"})
-Stations = sorted(set(StationData.get_column("Station")) - {""})
+Decades = tuple(f"{decade}-{decade % 100 + 9:02}"
+                for decade in range(1900, 2030, 10))
+
+# Reference periods for anomalies, given by the first and the last decade.
+# Climate normals (e.g. 1961-1990) are approximated by whole decades
+# (1960-1989), since data is aggregated by decades
+Baselines = ((1950, 1970), (1960, 1980), (1980, 2000), (1990, 2010))
+BaselineNames = [f"{first}-{last + 9}" for first, last in Baselines]
+
+
+def day_names(year):
+    """Return names of days in the year, e.g. "Jan 1"."""
+    return [f"{month[:3]} {day}"
+            for i, month in enumerate(Months, start=1)
+            for day in range(1, calendar.monthrange(year, i)[1] + 1)]
+
+
+SeasonNames = ("Winter", "Spring", "Summer", "Autumn")
+
+
+def day_periods(year, resolution):
+    """
+    Return the index of period for each day in the year, and names of
+    periods, for resolutions `OWClimateData.Days`, `Weeks`, `TenDays` and
+    `Seasons`.
+
+    Weeks start on January 1, and the last one or two days of the year
+    belong to the 52nd week. Ten-day periods split months at days 10 and
+    20. Seasons are meteorological; winter consists of January, February
+    and December of the same year.
+    """
+    days = np.arange(np.datetime64(f"{year}-01-01"),
+                     np.datetime64(f"{year + 1}-01-01"))
+    month_starts = days.astype("datetime64[M]")
+    months = month_starts.astype(int) % 12
+    if resolution == OWClimateData.Days:
+        return np.arange(len(days)), day_names(year)
+    if resolution == OWClimateData.Weeks:
+        return np.minimum(np.arange(len(days)) // 7, 51), \
+            [f"Week {week}" for week in range(1, 53)]
+    if resolution == OWClimateData.TenDays:
+        month_days = (days - month_starts).astype(int)
+        names = [f"{month[:3]} {first}-{last}"
+                 for i, month in enumerate(Months, start=1)
+                 for first, last in ((1, 10), (11, 20),
+                                     (21, calendar.monthrange(year, i)[1]))]
+        return 3 * months + np.minimum(month_days // 10, 2), names
+    return (months + 1) // 3 % 4, list(SeasonNames)
+
+
+# Data is loaded on first use, not on import: Orange imports widget modules
+# at startup, also when the widget is not used
+
+
+@cache
+def station_data():
+    return Table(os.path.join(DATA_DIR, "station-data.pkl.gz"))
+
+
+@cache
+def countries():
+    return [country for country in station_index().countries if country]
+
+
+@cache
+def continents():
+    cont_values = station_data().domain["Continent"].values
+    return sorted(set(cont_values) - {"", "?"})
+
+
+@cache
+def stations():
+    return sorted(set(station_data().get_column("Station")) - {""})
+
+
+@cache
+def last_monthly_year():
+    """
+    Return the last year for which monthly values are stored, or `None`;
+    years whose values were built for other stations are skipped.
+    """
+    years = monthly_years(codes=station_data().get_column("Code"))
+    return years[-1] if years else None
+
+
+@cache
+def station_countries():
+    """
+    Return indices of stations' countries in `countries_continents()`
+    (-1 for stations without a country), and the number of countries.
+    """
+    index = station_index()
+    names = countries_continents()[:, 0]
+    # Map countries of the index (sorted) to their rows in `names`
+    order = np.argsort(names)
+    positions = order[np.minimum(
+        np.searchsorted(names, index.countries, sorter=order),
+        len(names) - 1)]
+    mapping = np.where(names[positions] == index.countries, positions, -1)
+    return mapping[index.country_codes], len(names)
+
+
+def is_stored(name):
+    """
+    Tell whether array `name` is stored, or derived from stored arrays.
+    """
+    prefix, prop = split_name(name)
+    if prop in DERIVED:
+        return all(has_array(prefix + source) for source in DERIVED[prop][0])
+    return has_array(name)
+
+
+def climate_array(name):
+    """
+    Return array `name` (see `get_array`).
+
+    Arrays for countries that are not stored, e.g. "C-M2024-tavg" from
+    older datasets, are aggregated from arrays for stations when first
+    requested, and kept in the shared cache.
+    """
+    if name.startswith("C-") and not is_stored(name):
+        return array_cache.get(
+            name,
+            lambda: group_reduce(np.asarray(get_array("S" + name[1:])),
+                                 *station_countries()))
+    return get_array(name)
+
+
+@cache
+def daily_prefixes():
+    """
+    Return prefixes of arrays with daily values, by years; partitions that
+    were built for other stations are skipped, since their rows would not
+    match the stations.
+    """
+    codes = station_data().get_column("Code")
+    return {year: prefix for year, prefix in daily_partitions().items()
+            if partition_matches(prefix, codes)}
+
+
+@cache
+def daily_stations():
+    """
+    Return stations with daily values in any year, or `None` if daily
+    values are not included.
+    """
+    prefixes = daily_prefixes()
+    if not prefixes:
+        return None
+    daily_mask = np.any(
+        [get_array(prefix + "mask") for prefix in prefixes.values()], axis=0)
+    return sorted(
+        set(station_data().get_column("Station")[daily_mask]) - {""})
+
+
+def include_daily_values():
+    return daily_stations() is not None
+
+
+@cache
+def countries_continents():
+    return get_array("countries")
+
+
+@cache
+def station_index():
+    return StationIndex(station_data())
+
+
+@cache
+def station_elevations():
+    data = station_data()
+    if "Elevation" in data.domain:
+        return data.get_column("Elevation")
+    # Names of variables in the shipped data are broken (see
+    # `spatial.coordinates`); elevation is the third continuous variable
+    return data.get_column(
+        [var for var in data.domain.metas if var.is_continuous][2])
+
+
+def discrete_labels(data, var):
+    """Return an array with labels of discrete `var`; "" for missing values."""
+    column = data.get_column(var)
+    labels = np.array([""] + list(var.values), dtype=object)
+    return labels[np.nan_to_num(column, nan=-1).astype(int) + 1]
+
+
+@cache
+def spatial_index():
+    return SpatialIndex(*coordinates(station_data()))
+
+
+@cache
+def grid_index():
+    return GridIndex(*coordinates(station_data()))
+
+
+_Coordinates = re.compile(
+    r"^\s*([-+]?(?:\d+(?:\.\d*)?|\.\d+))\s*[,;\s]"
+    r"\s*([-+]?(?:\d+(?:\.\d*)?|\.\d+))\s*$")
+
+
+def parse_area(text):
+    """
+    Return vertices (rows with latitude and longitude) of an area given as
+    text, or `None` if the text is invalid.
+
+    The area is either a bounding box, "south, west, north, east", or a list
+    of vertices, "lat, lon; lat, lon; ...". A bounding box is returned as
+    two vertices, the south-west and north-east corner.
+    """
+    try:
+        points = [[float(x) for x in re.split(r"[,\s]+", part.strip())]
+                  for part in text.split(";") if part.strip()]
+    except ValueError:
+        return None
+    if len(points) == 1 and len(points[0]) == 4:
+        return np.array(points[0]).reshape(2, 2)
+    if len(points) >= 2 and all(len(point) == 2 for point in points):
+        return np.array(points)
+    return None
+
+
+@cache
+def locate(text):
+    """
+    Return latitude and longitude of a location, given either as coordinates
+    (e.g. "46.07, 14.52") or as the beginning of a station name (e.g. a city,
+    "Ljubljana"), or `None` if the location is not found.
+
+    If multiple stations match the name, the first in alphabetical order is
+    taken.
+    """
+    match = _Coordinates.match(text)
+    if match:
+        lat, lon = map(float, match.groups())
+        if -90 <= lat <= 90 and -180 <= lon <= 360:
+            return lat, lon
+        return None
+
+    text = text.strip().upper()
+    if not text:
+        return None
+    names = station_data().get_column("Station").astype(str)
+    rows = np.flatnonzero(np.char.startswith(np.char.upper(names), text))
+    if not len(rows):
+        return None
+    row = min(rows, key=names.__getitem__)
+    lat, lon = (coords[row] for coords in coordinates(station_data()))
+    if np.isnan(lat) or np.isnan(lon):
+        return None
+    return lat, lon
 
 
-try:
-    _daily_mask = pickle.load(dopen("S-Y-mask.pkl", "rb"))
-    DailyStations = sorted(set(StationData.get_column("Station")[_daily_mask]) - {""})
-except:
-    # If the file is not available, we assume that daily values are not included
-    INCLUDE_DAILY_VALUES = False
-    DailyStations = []
-else:
-    INCLUDE_DAILY_VALUES = True
+# Output variables and domains are created once and reused, so that
+# downstream widgets get the same domain for the same kind of output
+StationVar = StringVariable("Station")
+DistanceVar = ContinuousVariable("Distance [km]", number_of_decimals=1)
+StationCountVar = ContinuousVariable("Stations", number_of_decimals=0)
+DecadeVar = DiscreteVariable("Decade", values=Decades)
+
+
+@cache
+def group_variable(name):
+    return StringVariable(name)
+
+
+@cache
+def output_variable(name):
+    return ContinuousVariable(name)
+
+
+@cache
+def output_domain(attrs, meta_attrs):
+    """
+    Return domain with continuous attributes with the given names and
+    the given meta attributes.
+
+    :param attrs: names of attributes
+    :param meta_attrs: meta attributes
+    :type attrs: tuple of str
+    :type meta_attrs: tuple of Variable
+    """
+    return Domain([output_variable(attr) for attr in attrs], None, meta_attrs)
 
-CountriesContinents = pickle.load(dopen("countries.pkl", "rb"))
 
 DefaultContinent = "Europe"
 DefaultCountry = "Slovenia"
 DefaultStation = "LJUBLJANA BEZIGRAD, SI"
+DefaultLocation = "Ljubljana"
+DefaultArea = "43.5, 5, 48.5, 16.5"  # the Alps
+
+# Choices for grouping of stations; input data can add its discrete columns
+NoGrouping = "None"
+StationGroups = ("Country", "Continent", "Elevation band")
+ElevationBand = 500  # m
+
+# Delay (in ms) before running a query; callbacks that come in a burst,
+# e.g. when a combo changes the selected radio button, result in one query
+UPDATE_DELAY = 50
+
+# Number of output tables kept for re-sending when settings return to
+# an earlier selection
+OUTPUT_CACHE_SIZE = 8
 
-class OWClimateData(OWWidget):
+
+class OWClimateData(OWWidget, ConcurrentWidgetMixin):
     name = "Climate Data"
     description = "Climate data"
     icon = "icons/climatedata.svg"
     priority = 10
 
     class Error(OWWidget.Error):
-        select_single = Msg("Select a single station")
         invalid_in_selection = Msg("Input data does not have a column 'Station'")
+        unknown_location = Msg("Unknown location '{}'")
+        no_stations_near = Msg("No stations within {} km")
+        invalid_area = Msg(
+            "Area must be given as 'south, west, north, east' or as "
+            "vertices 'latitude, longitude; latitude, longitude; ...'")
+        invalid_area_input = Msg(
+            "Area data must contain at least two points with latitudes "
+            "and longitudes")
+        no_stations_in_area = Msg("No stations in the area")
+        no_daily_values = Msg("No daily values for {}–{}")
+        load_error = Msg("Data could not be loaded: {}")
 
     class Warning(OWWidget.Warning):
         missing_stations = Msg("Some selected stations are missing in the data set")
 
     class Inputs:
         stations = Input("Weather Stations", Table)
+        area = Input("Area", Table)
 
     class Outputs:
         data = Output("Climate Data", Table)
 
-    _AllGeo = Countries, CountriesOnContinent, Country, SingleStation = range(4)
-    TotalMonthly, MonthlyByDecades, MonthMeanByDecades, DailyValues = range(4)
+    _AllGeo = Countries, CountriesOnContinent, Country, SingleStation, \
+        NearLocation, InArea = range(6)
+    TotalMonthly, MonthlyByDecades, MonthMeanByDecades, DailyValues, \
+        LastYearMonthly = range(5)
 
     Allowed = {
         TotalMonthly: _AllGeo,
         MonthMeanByDecades: _AllGeo,
-        MonthlyByDecades: (SingleStation, ),
-        DailyValues: (Country, SingleStation)
+        MonthlyByDecades: _AllGeo,
+        DailyValues: (Country, SingleStation, NearLocation, InArea),
+        LastYearMonthly: _AllGeo,
     }
 
     Avg, Min, Max, Span = range(4)
+    Days, Weeks, TenDays, Seasons = range(4)
 
     geo_selection = Setting(Countries)
     continent = Setting(DefaultContinent)
     country = Setting(DefaultCountry)
     station = Setting(DefaultStation)
+    location = Setting(DefaultLocation)
+    near_count = Setting(10)
+    near_radius = Setting(100)
+    area = Setting(DefaultArea)
 
     time_selection = Setting(TotalMonthly)
     month_index = Setting(0)
+    first_year = Setting(0)
+    last_year = Setting(0)
+    daily_resolution = Setting(Days)
 
     get_temperature = Setting(True)
     temperature_value = Setting(0)
     get_precipitation = Setting(False)
+    anomalies = Setting(False)
+    baseline = Setting(1)
+
+    group_by = Setting(NoGrouping)
+    aggregation = Setting(0)
 
     want_main_area = False
     resizing_enabled = False
 
     def __init__(self):
-        super().__init__()
+        OWWidget.__init__(self)
+        ConcurrentWidgetMixin.__init__(self)
         self.selected_stations = None
-
+        self.area_vertices = None
+        self._stations_key = None
+        self._output_cache = OrderedDict()
+        self._pending_key = None
+
+        self._update_timer = QTimer(
+            self, singleShot=True, interval=UPDATE_DELAY,
+            timeout=self._run_query)
+
+        if (self.time_selection == self.DailyValues
+                and not include_daily_values()) \
+                or (self.time_selection == self.LastYearMonthly
+                    and last_monthly_year() is None):
+            self.time_selection = self.TotalMonthly
         tf = gui.radioButtonsInBox(
             self.controlArea, self, "time_selection", box="Time Frame",
             callback=self.time_selection_changed)
         tf.layout().setSpacing(1)
         gui.appendRadioButton(
             tf, "All-time monthly means", insertInto=gui.hBox(tf))
+        # Shown below all-time means, but added last to keep the index
+        last_year_box = gui.hBox(tf)
         tf.layout().addSpacing(6)
         gui.appendRadioButton(
             tf, "Monthly means by decades", insertInto=gui.hBox(tf))
@@ -118,14 +453,39 @@ class OWClimateData(OWWidget):
             callback=self.month_changed,
             sizePolicy=(QSizePolicy.MinimumExpanding, QSizePolicy.Fixed)
         )
-        if INCLUDE_DAILY_VALUES:
-            gui.appendRadioButton(
-                tf, "Daily values", insertInto=gui.hBox(tf))
+        # The button is added also if it is hidden, to keep the index
+        b = gui.hBox(tf)
+        gui.appendRadioButton(tf, "Daily values for", insertInto=b)
+        if not include_daily_values():
+            b.hide()
+        else:
+            years = list(daily_prefixes())
+            if not years[0] <= self.first_year <= years[-1]:
+                self.first_year = years[-1]
+            if not self.first_year <= self.last_year <= years[-1]:
+                self.last_year = self.first_year
+            gui.spin(
+                b, self, "first_year", years[0], years[-1],
+                callback=self.first_year_changed)
+            gui.spin(
+                b, self, "last_year", years[0], years[-1], label="to",
+                callback=self.last_year_changed)
+            gui.comboBox(
+                b, self, "daily_resolution", label="by",
+                items=["days", "weeks", "ten days", "seasons"],
+                sendSelectedValue=False,
+                callback=self._daily_changed)
+        gui.appendRadioButton(
+            tf, f"Monthly means for {last_monthly_year()}",
+            insertInto=last_year_box)
+        if last_monthly_year() is None:
+            last_year_box.hide()
 
         self.station_selector = ss = gui.radioButtonsInBox(
             self.controlArea, self, "geo_selection", box="Weather Stations",
             callback=self.geo_selection_changed)
-        self.station_boxes = [gui.hBox(ss) for _ in range(4)]
+        self.station_boxes = \
+            [gui.hBox(ss) for _ in range(4)] + [gui.vBox(ss), gui.hBox(ss)]
         ss.layout().insertSpacing(1, 3)
         boxi = iter(self.station_boxes)
         self.station_selector.layout().setSpacing(1)
@@ -136,7 +496,7 @@ class OWClimateData(OWWidget):
             ss, "Countries on continent:", insertInto=b)
         gui.comboBox(
             b, self, "continent",
-            items=Continents,
+            items=continents(),
             sendSelectedValue=True,
             callback=self.continent_changed,
             sizePolicy=(QSizePolicy.MinimumExpanding, QSizePolicy.Fixed)
@@ -146,7 +506,7 @@ class OWClimateData(OWWidget):
         gui.appendRadioButton(ss, "Country: ", insertInto=b)
         gui.comboBox(
             b, self, "country",
-            items=Countries,
+            items=countries(),
             sendSelectedValue=True,
             callback=self.country_changed,
             sizePolicy=(QSizePolicy.MinimumExpanding, QSizePolicy.Fixed)
@@ -157,12 +517,59 @@ class OWClimateData(OWWidget):
             ss, "Single station: ", insertInto=b)
         gui.comboBox(
             b, self, "station",
-            items=Stations,
+            items=stations(),
             sendSelectedValue=True,
             callback=self.single_station_changed,
             sizePolicy=(QSizePolicy.MinimumExpanding, QSizePolicy.Fixed)
         )
 
+        vb = next(boxi)
+        b = gui.hBox(vb)
+        gui.appendRadioButton(ss, "Stations near: ", insertInto=b)
+        gui.lineEdit(
+            b, self, "location",
+            placeholderText="city or latitude, longitude",
+            callback=self.near_location_changed
+        )
+        b = gui.hBox(vb)
+        gui.spin(
+            b, self, "near_count", 1, 1000, label="up to ",
+            callback=self.near_location_changed
+        )
+        gui.spin(
+            b, self, "near_radius", 1, 20100, step=10,
+            label=" stations within ", callback=self.near_location_changed
+        )
+        gui.widgetLabel(b, " km")
+        gui.rubber(b)
+
+        b = next(boxi)
+        gui.appendRadioButton(ss, "In area: ", insertInto=b)
+        gui.lineEdit(
+            b, self, "area",
+            placeholderText="south, west, north, east",
+            tooltip="Bounding box, 'south, west, north, east', or\n"
+                    "polygon, 'lat, lon; lat, lon; lat, lon; ...'",
+            callback=self.area_changed
+        )
+
+        self.group_box = b = gui.hBox(self.controlArea, "Aggregate Stations")
+        if self.group_by not in self._group_items():
+            self.group_by = NoGrouping
+        gui.comboBox(
+            b, self, "group_by", label="Group by: ",
+            items=self._group_items(),
+            sendSelectedValue=True,
+            callback=self.aggregation_changed,
+            sizePolicy=(QSizePolicy.MinimumExpanding, QSizePolicy.Fixed)
+        )
+        gui.comboBox(
+            b, self, "aggregation",
+            items=["Mean", "Minimum", "Maximum", "Count"],
+            sendSelectedValue=False,
+            callback=self.aggregation_changed
+        )
+
         vb = gui.vBox(self.controlArea, "Values")
         b = gui.hBox(vb)
         gui.checkBox(
@@ -182,13 +589,63 @@ class OWClimateData(OWWidget):
             callback=self.value_selection_changed
         )
 
+        self.anomalies_box = b = gui.hBox(vb)
+        gui.checkBox(
+            b, self, "anomalies", "Differences from means for ",
+            callback=self.value_selection_changed
+        )
+        gui.comboBox(
+            b, self, "baseline",
+            items=BaselineNames,
+            sendSelectedValue=False,
+            callback=self.baseline_changed,
+        )
+        gui.rubber(b)
+
         self._update_time_selection()
         self.update_data()
 
     @Inputs.stations
     def set_stations(self, data):
         self.selected_stations = data
+        self._stations_key = stations_key(data)
         self.station_selector.setDisabled(data is not None)
+        self._update_group_items()
+        self.update_data()
+
+    def _group_items(self):
+        """Return choices for grouping: fixed and discrete input columns."""
+        items = [NoGrouping, *StationGroups]
+        if self.selected_stations is not None:
+            domain = self.selected_stations.domain
+            items += [var.name for var in domain.variables + domain.metas
+                      if var.is_discrete and var.name not in items]
+        return items
+
+    def _update_group_items(self):
+        items = self._group_items()
+        group_by = self.group_by if self.group_by in items else NoGrouping
+        combo = self.controls.group_by
+        combo.clear()
+        combo.addItems(items)
+        self.group_by = group_by
+
+    @Inputs.area
+    def set_area(self, data):
+        self.Error.invalid_area_input.clear()
+        self.area_vertices = None
+        if data is not None:
+            try:
+                vertices = np.column_stack(coordinates(data))
+            except ValueError:
+                vertices = np.empty((0, 2))
+            vertices = vertices[np.isfinite(vertices).all(axis=1)]
+            if len(vertices) < 2:
+                self.Error.invalid_area_input()
+            else:
+                self.area_vertices = vertices
+                self.geo_selection = self.InArea
+        self.controls.area.setDisabled(self.area_vertices is not None)
         self.update_data()
 
     def continent_changed(self):
@@ -203,6 +660,14 @@ class OWClimateData(OWWidget):
         self.geo_selection = self.SingleStation
         self.geo_selection_changed()
 
+    def area_changed(self):
+        self.geo_selection = self.InArea
+        self.geo_selection_changed()
+
+    def near_location_changed(self):
+        self.geo_selection = self.NearLocation
+        self.geo_selection_changed()
+
     def geo_selection_changed(self):
         self.update_data()
 
@@ -211,76 +676,236 @@ class OWClimateData(OWWidget):
         self.time_selection_changed()
 
     def _update_time_selection(self):
+        self.anomalies_box.setEnabled(self._by_decades())
         allowed = self.Allowed[self.time_selection]
         for i, button in enumerate(self.station_boxes):
             button.setDisabled(i not in allowed)
         if self.geo_selection not in allowed:
             self.geo_selection = allowed[0]
 
-        stations = DailyStations if self.time_selection == self.DailyValues \
-            else Stations
+        names = daily_stations() if self.time_selection == self.DailyValues \
+            else stations()
         stat_combo = self.controls.station
-        if stat_combo.count() != len(stations):
+        if stat_combo.count() != len(names):
             prev_station = self.station
             stat_combo.clear()
-            stat_combo.addItems(stations)
-            if prev_station in stations:
+            stat_combo.addItems(names)
+            if prev_station in names:
                 self.station = prev_station
             else:
-                assert DefaultStation in stations
+                assert DefaultStation in names
                 self.station = DefaultStation
 
     def time_selection_changed(self):
         self._update_time_selection()
         self.update_data()
 
+    def first_year_changed(self):
+        self.last_year = max(self.last_year, self.first_year)
+        self._daily_changed()
+
+    def last_year_changed(self):
+        self.first_year = min(self.first_year, self.last_year)
+        self._daily_changed()
+
+    def _daily_changed(self):
+        self.time_selection = self.DailyValues
+        self.time_selection_changed()
+
     def value_selection_changed(self):
         self.update_data()
 
+    def aggregation_changed(self):
+        self.update_data()
+
+    def baseline_changed(self):
+        self.anomalies = True
+        self.value_selection_changed()
+
+    def _by_decades(self):
+        return self.time_selection in (self.MonthlyByDecades,
+                                       self.MonthMeanByDecades)
+
     def update_data(self):
-        self.Error.select_single.clear()
+        """
+        Schedule a query; cancel the running query, if any.
+
+        Queries run in a worker thread, see `ClimateQuery`.
+        """
+        # All changes of geographic and time selection end up here
+        self.group_box.setEnabled(self._groupable())
+        self.cancel()
+        self._update_timer.start()
+
+    def _run_query(self):
         self.Error.invalid_in_selection.clear()
+        self.Error.unknown_location.clear()
+        self.Error.no_stations_near.clear()
+        self.Error.invalid_area.clear()
+        self.Error.no_stations_in_area.clear()
+        self.Error.no_daily_values.clear()
+        self.Error.load_error.clear()
         self.Warning.missing_stations.clear()
 
-        if not (self.get_precipitation or self.get_temperature):
+        query = self._query()
+        if query is None:
             self.Outputs.data.send(None)
             return
+        key = self._output_key()
+        if key in self._output_cache:
+            self._output_cache.move_to_end(key)
+            self.Outputs.data.send(self._output_cache[key])
+            return
+        self._pending_key = key
+        self.start(run_query, query)
 
-        tdata, pdata, attrs, meta, meta_attrs = self.Getters[self.time_selection](self)
-        if tdata is None and pdata is None:
-            self.Outputs.data.send(None)
+    def _output_key(self):
+        """
+        Return a key that identifies the output for the current settings
+        and input; settings that do not affect the output are omitted.
+        """
+        if self.selected_stations is not None:
+            geo = self._stations_key
+        elif self.geo_selection == self.CountriesOnContinent:
+            geo = (self.geo_selection, self.continent)
+        elif self.geo_selection == self.Country:
+            geo = (self.geo_selection, self.country)
+        elif self.geo_selection == self.SingleStation:
+            geo = (self.geo_selection, self.station)
+        elif self.geo_selection == self.NearLocation:
+            geo = (self.geo_selection, self.location,
+                   self.near_count, self.near_radius)
+        elif self.geo_selection == self.InArea:
+            geo = (self.geo_selection,
+                   self.area if self.area_vertices is None
+                   else self.area_vertices.tobytes())
+        else:
+            geo = self.geo_selection
+        return (self.time_selection,
+                self.month_index
+                if self.time_selection == self.MonthMeanByDecades else None,
+                (self.first_year, self.last_year, self.daily_resolution)
+                if self.time_selection == self.DailyValues else None,
+                self.baseline
+                if self.anomalies and self._by_decades() else None,
+                self.temperature_value if self.get_temperature else None,
+                self.get_precipitation,
+                geo,
+                self._grouping_key() if self._grouped() else None)
+
+    def _grouping_key(self):
+        """
+        Return a key for grouping; grouping by an input column includes its
+        values, which may change while stations remain the same.
+        """
+        if self.group_by in StationGroups:
+            return self.group_by, self.aggregation
+        selected = self.selected_stations
+        labels = discrete_labels(selected, selected.domain[self.group_by])
+        return self.group_by, self.aggregation, tuple(labels)
+
+    def _groupable(self):
+        """Tell whether stations can be aggregated in the current mode."""
+        return self.time_selection != self.MonthlyByDecades \
+            and (self.selected_stations is not None
+                 or self.geo_selection not in (self.Countries,
+                                               self.CountriesOnContinent))
+
+    def _grouped(self):
+        """Tell whether output rows are groups of stations."""
+        return self.group_by != NoGrouping and self._groupable()
+
+    def on_done(self, result):
+        data, attrs, meta, meta_attrs = result
+        domain = output_domain(tuple(attrs), tuple(meta_attrs))
+        table = Table.from_numpy(domain, data, None, meta)
+        self._output_cache[self._pending_key] = table
+        while len(self._output_cache) > OUTPUT_CACHE_SIZE:
+            self._output_cache.popitem(last=False)
+        self.Outputs.data.send(table)
+
+    def on_exception(self, ex):
+        if isinstance(ex, CancelledError):
             return
-        data = tdata if not self.get_precipitation \
-            else pdata if not self.get_temperature \
-            else np.hstack((tdata, pdata))
-        domain = Domain(
-            [ContinuousVariable(attr) for attr in attrs],
-            None,
-            meta_attrs
-        )
-        self.Outputs.data.send(Table.from_numpy(domain, data, None, meta))
+        self.Error.load_error(ex)
+        self.Outputs.data.send(None)
+
+    def onDeleteWidget(self):
+        self._update_timer.stop()
+        self.shutdown()
+        super().onDeleteWidget()
 
-    def _load_tdata(self, prefix):
+    def _query(self):
         """
-        Load temperature data for the given prefix, e.g. "C-MT-" or "S-M2024-".
+        Resolve the geographic selection and return a query with the current
+        settings, or `None` if nothing is to be shown.
+        """
+        if not (self.get_precipitation or self.get_temperature):
+            return None
+        if self.time_selection == self.DailyValues \
+                and not any(self.first_year <= year <= self.last_year
+                            for year in daily_prefixes()):
+            self.Error.no_daily_values(self.first_year, self.last_year)
+            return None
 
-        The methods loads avg, min, max or max - min, depending, as set in
-        self.temperature_value.
+        if self.selected_stations is not None:
+            indices, meta, meta_attrs = self._selection_indices()
+            if indices is None:
+                return None
+            prefix = "S"
+        elif self.geo_selection in (self.Countries, self.CountriesOnContinent):
+            indices, meta, meta_attrs = self._country_indices()
+            prefix = "C"
+        elif self.geo_selection in (self.NearLocation, self.InArea):
+            if self.geo_selection == self.NearLocation:
+                indices, meta, meta_attrs = self._near_indices()
+            else:
+                indices, meta, meta_attrs = self._area_indices()
+            if indices is None:
+                return None
+            prefix = "S"
+        else:
+            indices, meta, meta_attrs = self._station_indices()
+            prefix = "S"
+        groups = self._station_groups(indices) if self._grouped() else None
+        return ClimateQuery(self, prefix, indices, meta, meta_attrs, groups)
 
-        The data is loaded from the corresponding pickle.
+    def _station_groups(self, indices):
+        """
+        Return group codes for the given stations and labels of groups.
 
-        :param prefix: Prefix for the data file.
-        :return:
+        Stations are grouped by country, continent, elevation band, or by
+        a discrete column of the input data, whose rows are matched to
+        stations in the same way as in `_selection_indices`.
         """
-        if self.temperature_value == self.Avg:
-            return pickle.load(dopen(prefix + "tavg.pkl", "rb"))
-        elif self.temperature_value == self.Min:
-            return pickle.load(dopen(prefix + "tmin.pkl", "rb"))
-        elif self.temperature_value == self.Max:
-            return pickle.load(dopen(prefix + "tmax.pkl", "rb"))
+        data = station_data()
+        index = station_index()
+        if self.group_by == "Country":
+            return used_groups(index.country_codes[indices],
+                               index.countries.astype(object))
+        elif self.group_by == "Continent":
+            return used_groups(index.continent_codes[indices],
+                               index.continents.astype(object))
+        elif self.group_by == "Elevation band":
+            bands = station_elevations()[indices] // ElevationBand
+            codes, uniques = group_codes(bands * ElevationBand)
+            labels = np.array(
+                [f"{low:.0f}-{low + ElevationBand - 1:.0f} m"
+                 for low in uniques], dtype=object)
+            return codes, labels
         else:
-            return (pickle.load(dopen(prefix + "tmax.pkl", "rb"))
-                    - pickle.load(dopen(prefix + "tmin.pkl", "rb")))
+            selected = self.selected_stations
+            key = "Code" if "Code" in selected.domain else "Station"
+            input_keys = selected.get_column(key).astype(str)
+            input_values = discrete_labels(
+                selected, selected.domain[self.group_by])
+            order = np.argsort(input_keys, kind="stable")
+            positions = np.searchsorted(
+                input_keys[order], data.get_column(key)[indices].astype(str))
+            values = input_values[order][
+                np.minimum(positions, len(order) - 1)]
+        codes, uniques = group_codes(values)
+        return codes, uniques.astype(object)
 
     def _country_indices(self):
         """
@@ -296,14 +921,16 @@ class OWClimateData(OWWidget):
           - meta_attrs (list[str]):
               the names of meta attributes for the above.
         """
-        meta_attrs = [StationData.domain["Country"]]
+        domain = station_data().domain
+        countries_conts = countries_continents()
+        meta_attrs = [domain["Country"]]
         if self.geo_selection == self.Countries:
             indices = ...
-            meta_attrs.append(StationData.domain["Continent"])
-            meta = CountriesContinents
+            meta_attrs.append(domain["Continent"])
+            meta = countries_conts
         else:
-            indices = CountriesContinents[:, 1] == self.continent
-            meta = CountriesContinents[indices, :1]
+            indices = countries_conts[:, 1] == self.continent
+            meta = countries_conts[indices, :1]
         return indices, meta, meta_attrs
 
     def _station_indices(self):
@@ -312,7 +939,7 @@ class OWClimateData(OWWidget):
         stations in the selected country.
 
         :return: a tuple of
-          - indices (... or np.array of bool):
+          - indices (np.array of int):
               Index(-ices) of selected station(s)
           - meta (None or np.array of object):
               Station names, or None if a station is selected
@@ -321,52 +948,278 @@ class OWClimateData(OWWidget):
         """
 
         if self.geo_selection == self.SingleStation:
-            indices = np.flatnonzero(
-                StationData.get_column("Station") == self.station)
+            indices = station_index().by_name(self.station)
             meta_attrs = []
             meta = None
         else:
-            indices = np.flatnonzero(
-                StationData.get_column("Country") == self.country)
-            meta_attrs = [StringVariable("Station")]
-            meta = StationData.get_column("Station")[indices][:, None]
+            indices = station_index().by_country(self.country)
+            meta_attrs = [StationVar]
+            meta = station_data().get_column("Station")[indices][:, None]
+        return indices, meta, meta_attrs
+
+    def _near_indices(self):
+        """
+        Get the indices of stations nearest to the chosen location.
+
+        :return: a tuple of
+          - indices (np.array of int):
+              Indices of up to `near_count` stations within `near_radius` km,
+              sorted by distance
+          - meta (np.array of object):
+              Station names and distances
+          - meta_attrs (list[str]):
+              the names of meta attributes for the above.
+        """
+        nothing = (None, ) * 3
+        location = locate(self.location)
+        if location is None:
+            self.Error.unknown_location(self.location)
+            return nothing
+        indices, distances = spatial_index().nearest(
+            *location, k=self.near_count, radius=self.near_radius)
+        if not len(indices):
+            self.Error.no_stations_near(self.near_radius)
+            return nothing
+        meta_attrs = [StationVar, DistanceVar]
+        meta = np.empty((len(indices), 2), dtype=object)
+        meta[:, 0] = station_data().get_column("Station")[indices]
+        meta[:, 1] = distances
+        return indices, meta, meta_attrs
+
+    def _area_indices(self):
+        """
+        Get the indices of stations in the area from the input or settings.
+
+        Two vertices define a bounding box, and more vertices define a
+        polygon. A box given in settings as "south, west, north, east" may
+        cross the antimeridian (west > east); a box from the input is
+        spanned by any two opposite corners and never crosses it.
+
+        :return: a tuple of
+          - indices (np.array of int):
+              Sorted indices of stations in the area
+          - meta (np.array of object):
+              Station names and countries
+          - meta_attrs (list[str]):
+              the names of meta attributes for the above.
+        """
+        nothing = (None, ) * 3
+        vertices = self.area_vertices
+        from_input = vertices is not None
+        if not from_input:
+            vertices = parse_area(self.area)
+            if vertices is None:
+                self.Error.invalid_area()
+                return nothing
+        if len(vertices) == 2:
+            (south, west), (north, east) = vertices
+            if from_input:
+                west, east = min(west, east), max(west, east)
+            indices = grid_index().in_box(
+                min(south, north), west, max(south, north), east)
+        else:
+            indices = grid_index().in_polygon(vertices[:, 0], vertices[:, 1])
+        if not len(indices):
+            self.Error.no_stations_in_area()
+            return nothing
+        data = station_data()
+        meta_attrs = [data.domain["Station"], data.domain["Country"]]
+        meta = np.vstack((
+            data.get_column("Station")[indices],
+            data.get_column("Country")[indices])).T
         return indices, meta, meta_attrs
 
     def _selection_indices(self):
+        """
+        Get the indices of stations from the input data.
+
+        Stations are matched by codes, if the input has a column 'Code',
+        and by names otherwise.
+
+        :return: a tuple of
+          - indices (np.array of int):
+              Sorted indices of selected stations
+          - meta (None or np.array of object):
+              Station names and countries, or None for a single station
+          - meta_attrs (list[str]):
+              the names of meta attributes for the above.
+        """
         n = len(self.selected_stations)
         nothing = (None, ) * 3
         if n == 0:
             return nothing
-        if n > 1 and self.time_selection == self.MonthlyByDecades:
-            self.Error.select_single()
-            return nothing
-        if "Station" not in self.selected_stations.domain:
+        domain = self.selected_stations.domain
+        if "Station" not in domain:
             self.Error.invalid_in_selection()
             return nothing
 
-        indices = np.isin(StationData.get_column("Station"),
-                          self.selected_stations.get_column("Station"))
-        sel = np.sum(indices)
-        if sel == 0:
+        if "Code" in domain:
+            indices, found = station_index().by_codes(
+                self.selected_stations.get_column("Code"))
+        else:
+            indices, found = station_index().by_names(
+                self.selected_stations.get_column("Station"))
+        if found == 0:
             return nothing
-        if sel != n:
+        if found != n:
             self.Warning.missing_stations()
 
-        if n == 1:
+        if len(indices) == 1:
             meta_attrs = []
             meta = None
         else:
-            if self.time_selection == self.MonthlyByDecades:
-                self.Error.select_single()
-                return nothing
-            meta_attrs = [StationData.domain["Station"],
-                          StationData.domain["Country"]]
+            data = station_data()
+            meta_attrs = [data.domain["Station"], data.domain["Country"]]
             meta = np.vstack((
-                StationData.get_column("Country"),
-                StationData.get_column("Station"))).T
+                data.get_column("Station")[indices],
+                data.get_column("Country")[indices])).T
         return indices, meta, meta_attrs
 
 
+def stations_key(data):
+    """
+    Return a key that identifies stations in the input table, or `None` if
+    there is no input.
+
+    Stations are identified by column Code, if it exists, or by Station.
+    """
+    if data is None:
+        return None
+    domain = data.domain
+    column = "Code" if "Code" in domain else "Station"
+    if column not in domain:
+        return (column, len(data))
+    return (column, tuple(data.get_column(column)))
+
+
+def anomalies(data, first, end):
+    """
+    Return differences of data by decades (rows x months x decades) from
+    means over decades `first` to `end` (exclusive), ignoring NaNs.
+    """
+    baseline = data[..., first:end]
+    known = ~np.isnan(baseline)
+    with np.errstate(invalid="ignore"):
+        means = np.where(known, baseline, 0).sum(axis=-1) / known.sum(axis=-1)
+    return data - means[..., None]
+
+
+def run_query(query: "ClimateQuery", state: TaskState):
+    return query.run(state)
+
+
+class ClimateQuery:
+    """
+    A snapshot of widget's settings and selection, and methods to get data.
+
+    The query is constructed in the GUI thread; `run` is then called in a
+    worker thread, therefore methods must not access the widget.
+
+    Attributes:
+        prefix (str): "S" for stations or "C" for countries
+        indices (... or np.ndarray): rows of arrays with data
+        meta (np.ndarray or None): meta data for output
+        meta_attrs (list[Variable]): meta attributes for the above
+        groups (tuple or None): group codes of rows and labels of groups,
+            if rows are aggregated by groups
+    """
+    def __init__(self, widget: OWClimateData, prefix, indices, meta, meta_attrs,
+                 groups=None):
+        self.time_selection = widget.time_selection
+        self.month_index = widget.month_index
+        self.get_temperature = widget.get_temperature
+        self.temperature_value = widget.temperature_value
+        self.get_precipitation = widget.get_precipitation
+        self.group_by = widget.group_by
+        self.aggregation = REDUCTIONS[widget.aggregation]
+        self.daily_resolution = widget.daily_resolution
+        self.baseline = Baselines[widget.baseline] \
+            if widget.anomalies and widget._by_decades() else None
+        self.years = [year for year in daily_prefixes()
+                      if widget.first_year <= year <= widget.last_year] \
+            if self.time_selection == OWClimateData.DailyValues else []
+
+        self.prefix = prefix
+        self.indices = indices
+        self.meta = meta
+        self.meta_attrs = meta_attrs
+        self.groups = groups
+
+        self._state = None
+
+    def run(self, state: TaskState):
+        """
+        Return data, names of attributes, meta data and meta attributes.
+        """
+        self._state = state
+        tdata, pdata, attrs, meta, meta_attrs = \
+            self.Getters[self.time_selection](self)
+        if self.baseline is not None:
+            attrs = [f"Δ{attr}" for attr in attrs]
+        # Arrays may be views into the shared cache; hstack always copies
+        parts = [tdata] * self.get_temperature + [pdata] * self.get_precipitation
+        data = np.hstack(parts)
+        if self.groups is not None:
+            data, meta, meta_attrs = self._aggregate(data)
+        return data, attrs, meta, meta_attrs
+
+    def _aggregate(self, data):
+        """
+        Reduce rows of data by groups; return data, meta data and meta
+        attributes with labels of groups and numbers of stations.
+        """
+        codes, labels = self.groups
+        data = group_reduce(data, codes, len(labels), self.aggregation)
+        meta = np.empty((len(labels), 2), dtype=object)
+        meta[:, 0] = labels
+        meta[:, 1] = group_counts(codes, len(labels)).astype(float)
+        return data, meta, [group_variable(self.group_by), StationCountVar]
+
+    def _tdata_name(self, prefix):
+        """
+        Return the name of the array with temperature data for the given
+        prefix, e.g. "C-MT-" or "S-M2024-".
+
+        The array contains avg, min, max or span (max - min), as set in
+        self.temperature_value. Span is read from a file, if it exists,
+        or computed once and cached.
+        """
+        if self.temperature_value == OWClimateData.Avg:
+            return prefix + "tavg"
+        elif self.temperature_value == OWClimateData.Min:
+            return prefix + "tmin"
+        elif self.temperature_value == OWClimateData.Max:
+            return prefix + "tmax"
+        else:
+            return prefix + "tspan"
+
+    def _get_rows(self, names):
+        """
+        Return rows `self.indices` of arrays with the given names, and
+        report progress.
+
+        Arrays are loaded and indexed in parallel threads; decompression
+        releases the GIL, so the latency is that of the slowest array.
+        `.npy` and `.enc` files are memory-mapped, so indexing reads only
+        the selected rows, and encoded values are decoded only for those
+        rows.
+
+        Raises `CancelledError` if the task is cancelled.
+        """
+        state = self._state
+
+        def get_rows(name):
+            if state is not None and state.is_interruption_requested():
+                raise CancelledError
+            return climate_array(name)[self.indices]
+
+        with ThreadPoolExecutor(max(len(names), 1)) as executor:
+            futures = [executor.submit(get_rows, name) for name in names]
+            for done, _ in enumerate(as_completed(futures), start=1):
+                if state is not None:
+                    state.set_progress_value(100 * done / len(futures))
+            return [future.result() for future in futures]
+
     def _month_attrs(self):
         """
         Return names of attributes for monthly data.
@@ -375,88 +1228,141 @@ class OWClimateData(OWWidget):
             + (MonthPrecAttrs if self.get_precipitation else [])
 
     def _get_data(self, infix):
-        if self.selected_stations is not None:
-            indices, meta, meta_attrs = self._selection_indices()
-            prefix = "S"
-        elif self.geo_selection in (self.Countries, self.CountriesOnContinent):
-            indices, meta, meta_attrs = self._country_indices()
-            prefix = "C"
-        else:
-            indices, meta, meta_attrs = self._station_indices()
-            prefix = "S"
-        assert indices is not None, \
-            "Is this monthly mean going through _selection_indices via _get_data?"
-        tdata = (self.get_temperature and
-                 self._load_tdata(f"{prefix}-{infix}-")[indices])
-        pdata = (self.get_precipitation and
-                 pickle.load(dopen(f"{prefix}-{infix}-prcp.pkl", "rb"))[indices])
-        return tdata, pdata, meta, meta_attrs
+        prefix = f"{self.prefix}-{infix}-"
+        names = [self._tdata_name(prefix)] * self.get_temperature \
+            + [prefix + "prcp"] * self.get_precipitation
+        rows = iter(self._get_rows(names))
+        tdata = self.get_temperature and next(rows)
+        pdata = self.get_precipitation and next(rows)
+        return tdata, pdata, self.meta, self.meta_attrs
 
     def _total_monthly(self):
         tdata, pdata, meta, meta_attrs = self._get_data("MT")
         return tdata, pdata, self._month_attrs(), meta, meta_attrs
 
-    def _decades_monthly(self):
-        if self.selected_stations is None:
-            assert self.geo_selection == self.SingleStation
-            stationIdx = np.flatnonzero(
-                StationData.get_column("Station") == self.station)[0]
-        else:
-            indices, *_ = self._selection_indices()
-            if indices is None:
-                return None, None, [], None, []
-            stationIdx = np.flatnonzero(indices)[0]
-        if self.get_temperature:
-            tdata = self._load_tdata("S-MD-")[stationIdx].T
-        else:
-            tdata = np.array((13, 0))
-        if self.get_precipitation:
-            pdata = pickle.load(dopen("S-MD-prcp.pkl", "rb"))[stationIdx].T
-        else:
-            pdata = np.array((13, 0))
-        decades = tuple(f"{decade}-{decade % 100 + 9:02}"
-                        for decade in range(1900, 2030, 10))
-        meta_attrs = [DiscreteVariable("Decade", values=decades)]
-        meta = np.arange(len(decades))[:, None]
+    def _last_year_monthly(self):
+        tdata, pdata, meta, meta_attrs = \
+            self._get_data(f"M{last_monthly_year()}")
         return tdata, pdata, self._month_attrs(), meta, meta_attrs
 
-    def _month_by_decades(self):
+    def _get_decades(self):
+        """
+        Return data by decades, as `_get_data("MD")`; with a baseline,
+        values are differences from means over the baseline decades.
+
+        Means are computed from the rows that are already gathered, in
+        a single pass over the baseline decades of all rows and months.
+        """
         tdata, pdata, meta, meta_attrs = self._get_data("MD")
+        if self.baseline is not None:
+            first, last = ((year - 1900) // 10 for year in self.baseline)
+            tdata = self.get_temperature and anomalies(tdata, first, last + 1)
+            pdata = self.get_precipitation \
+                and anomalies(pdata, first, last + 1)
+        return tdata, pdata, meta, meta_attrs
+
+    def _decades_monthly(self):
+        """
+        Return monthly data by decades in long format, with a row for each
+        pair of a selected row (station or country) and a decade.
+
+        Rows are gathered from arrays of shape (rows, months, decades) at
+        once and reshaped. Without meta data (a single station), the output
+        has a row for each decade; otherwise, pairs without any data are
+        omitted.
+        """
+        tdata, pdata, meta, meta_attrs = self._get_decades()
+        data = tdata if self.get_temperature else pdata
+        nrows, ndecades = len(data), len(Decades)
+
+        def stack(data):
+            nmonths = data.shape[1]
+            return data.swapaxes(1, 2).reshape(nrows * ndecades, nmonths)
+
+        tdata = self.get_temperature and stack(tdata)
+        pdata = self.get_precipitation and stack(pdata)
+        decades = np.tile(np.arange(ndecades), nrows)
+        if meta is None:
+            return tdata, pdata, self._month_attrs(), \
+                decades[:, None], [DecadeVar]
+
+        parts = [tdata] * self.get_temperature \
+            + [pdata] * self.get_precipitation
+        known = np.any([~np.isnan(part).all(axis=1) for part in parts], axis=0)
+        meta = np.column_stack(
+            (np.repeat(meta, ndecades, axis=0), decades)).astype(object)
+        tdata = self.get_temperature and tdata[known]
+        pdata = self.get_precipitation and pdata[known]
+        return tdata, pdata, self._month_attrs(), \
+            meta[known], meta_attrs + [DecadeVar]
+
+    def _month_by_decades(self):
+        tdata, pdata, meta, meta_attrs = self._get_decades()
         attrs = []
         if self.get_temperature:
             tdata = tdata[:, self.month_index]
-            attrs += [f"T-{decade}-{decade % 100 + 9:02}"
-                     for decade in range(1900, 2030, 10)]
+            attrs += [f"T-{decade}" for decade in Decades]
         if self.get_precipitation:
             pdata = pdata[:, self.month_index]
-            attrs += [f"P-{decade}-{decade % 100 + 9:02}"
-                      for decade in range(1900, 2030, 10)]
+            attrs += [f"P-{decade}" for decade in Decades]
         return tdata, pdata, attrs, meta, meta_attrs
 
     def _daily_values(self):
-        tdata, pdata, meta, meta_attrs = self._get_data("Y")
-        ndays = [31, 28 + (tdata.shape[1] == 366), 31, 30, 31, 30,
-                31, 31, 30, 31, 30, 31]
-        daynames = [f"{month[:3]} {day + 1}"
-                    for month, days in zip(Months, ndays)
-                    for day in range(days)]
+        """
+        Return daily values for the chosen years, or their means over weeks,
+        ten-day periods or seasons (see `day_periods`); precipitation is
+        summed over periods, with missing days replaced by the mean.
+
+        Each year is stored in a separate partition. Rows of the selected
+        stations are read from partitions of all years at once (see
+        `_get_rows`) and concatenated; names of attributes include years
+        if more than one year is chosen.
+        """
+        prefixes = [daily_prefixes()[year] for year in self.years]
+        tnames = [self._tdata_name(prefix) for prefix in prefixes]
+        pnames = [prefix + "prcp" for prefix in prefixes]
+        rows = self._get_rows(tnames * self.get_temperature
+                              + pnames * self.get_precipitation)
+        periods = [day_periods(year, self.daily_resolution)
+                   for year in self.years]
+        if len(self.years) == 1:
+            names = periods[0][1]
+        else:
+            names = [f"{year} {name}"
+                     for year, (_, year_names) in zip(self.years, periods)
+                     for name in year_names]
+
+        def resample(parts, total):
+            if self.daily_resolution == OWClimateData.Days:
+                return np.hstack(parts)
+            resampled = []
+            for part, (codes, year_names) in zip(parts, periods):
+                means = group_reduce(part.T, codes, len(year_names)).T
+                if total:
+                    means *= group_counts(codes, len(year_names))
+                resampled.append(means)
+            return np.hstack(resampled)
+
         attrs = []
+        tdata = pdata = None
         if self.get_temperature:
-            attrs += [f"T-{d}" for d in daynames]
-            tdata /= 10
+            attrs += [f"T-{name}" for name in names]
+            tdata = resample(rows[:len(prefixes)], False) / 10
         if self.get_precipitation:
-            attrs += [f"P-{d}" for d in daynames]
-        return tdata, pdata, attrs, meta, meta_attrs
+            attrs += [f"P-{name}" for name in names]
+            pdata = resample(rows[-len(prefixes):], True)
+        return tdata, pdata, attrs, self.meta, self.meta_attrs
 
 
     Getters = {
-      TotalMonthly: _total_monthly,
-      MonthlyByDecades: _decades_monthly,
-      MonthMeanByDecades: _month_by_decades,
-      DailyValues: _daily_values
+      OWClimateData.TotalMonthly: _total_monthly,
+      OWClimateData.MonthlyByDecades: _decades_monthly,
+      OWClimateData.MonthMeanByDecades: _month_by_decades,
+      OWClimateData.DailyValues: _daily_values,
+      OWClimateData.LastYearMonthly: _last_year_monthly
     }
 
 if __name__ == "__main__":
     WidgetPreview(OWClimateData).run()
-    # WidgetPreview(OWClimateData).run(set_stations=StationData[:1])
-    # WidgetPreview(OWClimateData).run(set_stations=StationData[:10])
+    # WidgetPreview(OWClimateData).run(set_stations=station_data()[:1])
+    # WidgetPreview(OWClimateData).run(set_stations=station_data()[:10])
@@ -24,8 +24,10 @@ from Orange.classification.logistic_regression import (
     LogisticRegressionLearner, LogisticRegressionClassifier)
 
 
-cars_table = Table(
-    os.path.join(os.path.dirname(__file__), "..", 'datasets', 'cars.xlsx'))
+@cache
+def cars_table():
+    return Table(
+        os.path.join(os.path.dirname(__file__), "..", 'datasets', 'cars.xlsx'))
 
 BUTTON_STYLE = """
     QPushButton {
@@ -281,7 +283,7 @@ class OWComPair(OWWidget):
         layout.addWidget(self.score_curve, 7, 0, 1, 3, Qt.AlignCenter)
 
 
-        self.set_data(cars_table)
+        self.set_data(cars_table())
 
     def set_buttons_enabled(self, enabled):
         buttons = (self.next_button, self.restart_button,
@@ -314,7 +316,7 @@ class OWComPair(OWWidget):
         self.image_column = None
 
         if data is None:
-            data = cars_table
+            data = cars_table()
 
         if not all(var.is_continuous for var in data.domain.attributes) \
                 or data.has_missing():
@@ -1,9 +1,11 @@
 import os.path
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Callable
 from concurrent.futures import Future, CancelledError
 
 import numpy as np
+from scipy.sparse import csr_matrix, csc_matrix
 
 from AnyQt.QtCore import (
     Qt, QSize, QAbstractTableModel, QModelIndex, QRect, QUrl, Slot)
@@ -22,6 +24,44 @@ from orangecontrib.imageanalytics.widgets.owimageviewer import (
 from orangewidget.utils.concurrent import FutureWatcher
 from orangewidget.widget import Msg
 
+# Number of elements in the dense matrix with scores of persons whose
+# recommendations are computed at once; chunks of persons are sized so that
+# the matrix does not exceed it, regardless of the number of items
+RECOMMENDATION_BUDGET = 2 ** 22
+
+# Number of cells whose lists of recommenders are kept by the model
+RECOMMENDERS_CACHE_SIZE = 1024
+
+
+def choice_matrix(x):
+    """
+    Return a sparse boolean CSR matrix of choices of persons (rows) for items
+    (columns); zeros and missing values are not choices.
+
+    :param x: dense array or sparse matrix with choices
+    """
+    x = csr_matrix(x, dtype=float, copy=True)
+    x.data = np.nan_to_num(x.data)
+    x.eliminate_zeros()
+    x.sort_indices()
+    return csr_matrix(x, dtype=bool)
+
+
+def chosen_items(choices):
+    """Return arrays of indices of items chosen by each person."""
+    return np.split(choices.indices, choices.indptr[1:-1])
+
+
+def recommenders_of(neighbours, choices, item):
+    """
+    Return neighbours who chose the item, in the order of `neighbours`.
+
+    :param neighbours: indices of neighbours of a person
+    :param choices: sparse boolean matrix of choices (see `choice_matrix`)
+    :param item: index of item
+    """
+    return neighbours[choices[neighbours, item].toarray().ravel()]
+
 
 def height(text, font=None, bold=False):
     if font is None:
@@ -138,8 +178,14 @@ class CartoonTableModel(QAbstractTableModel):
 
         self.friends: Optional[list[list[tuple[int, float]]]] = None
         self.chosen_items: Optional[list[list[int]]] = None
-        self.recommendations: Optional[list[list[int]]] = None
-        self.recommenders: Optional[list[list[list[int]]]] = None
+        self.recommendations: Optional[list[np.ndarray]] = None
+        # function that returns recommenders of a person (row) for an item;
+        # lists are computed when a cell is shown and cached
+        self.recommenders: Optional[Callable[[int, int], np.ndarray]] = None
+        self.recommenders_cache: OrderedDict[tuple[int, int], np.ndarray] \
+            = OrderedDict()
+        # ranges of cells (top, left, bottom, right) that show each image
+        self.image_ranges: dict[int, tuple[int, int, int, int]] = {}
 
         self.pending: Optional[dict[Future[QImage], int]] = None
         self.image_cache: dict[str, CartoonTableModel._Item] = {}
@@ -158,6 +204,8 @@ class CartoonTableModel(QAbstractTableModel):
         self.chosen_items = chosen_items
         self.recommendations = recommendations
         self.recommenders = recommenders
+        self.recommenders_cache.clear()
+        self.image_ranges = self._image_ranges()
         if self.urls is not None:
             self.start_download()
         self.endResetModel()
@@ -175,6 +223,8 @@ class CartoonTableModel(QAbstractTableModel):
         self.chosen_items = None
         self.recommendations = None
         self.recommenders = None
+        self.recommenders_cache.clear()
+        self.image_ranges = {}
         self.pending: dict[Future[QImage], int] = None
         self.endResetModel()
 
@@ -229,13 +279,59 @@ class CartoonTableModel(QAbstractTableModel):
 
         if role == Qt.ItemDataRole.DisplayRole:
             title = self.items[self.recommendations[row][column]]
-            recommenders = ', '.join(self.names[self.recommenders[row][column]])
+            recommenders = ', '.join(
+                self.names[self.get_recommenders(row, column)])
             if recommenders:
                 recommenders = f"({recommenders})"
             return f"{title}\x00{recommenders}"
 
         return None
 
+    def get_recommenders(self, row, column):
+        """
+        Return persons who recommended the item in the given column; lists
+        for the most recently shown cells are cached.
+        """
+        key = (row, column)
+        cache = self.recommenders_cache
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        recommenders = self.recommenders(row, self.recommendations[row][column])
+        cache[key] = recommenders
+        if len(cache) > RECOMMENDERS_CACHE_SIZE:
+            cache.popitem(last=False)
+        return recommenders
+
+    def _image_ranges(self):
+        """
+        Return a dict that maps indices of images to the smallest ranges of
+        cells (top, left, bottom, right) that contain all cells showing them.
+        """
+        lengths = np.array([len(items) for items in self.recommendations],
+                           dtype=int)
+        if not lengths.any():
+            return {}
+        images = np.concatenate(self.recommendations).astype(int)
+        view_rows = np.empty(len(lengths), dtype=int)
+        view_rows[self.row_order] = np.arange(len(lengths))
+        rows = np.repeat(view_rows, lengths)
+        # the first column shows persons
+        columns = (np.arange(len(images)) + 1
+                   - np.repeat(np.cumsum(lengths) - lengths, lengths))
+
+        order = np.argsort(images, kind="stable")
+        images, rows, columns = images[order], rows[order], columns[order]
+        starts = np.flatnonzero(np.diff(images, prepend=-1))
+        return {
+            image: tuple(bounds)
+            for image, *bounds in zip(
+                images[starts].tolist(),
+                np.minimum.reduceat(rows, starts).tolist(),
+                np.minimum.reduceat(columns, starts).tolist(),
+                np.maximum.reduceat(rows, starts).tolist(),
+                np.maximum.reduceat(columns, starts).tolist())}
+
     @dataclass
     class _Item:
         image: Optional[QPixmap]
@@ -248,10 +344,9 @@ class CartoonTableModel(QAbstractTableModel):
         # the other is to add a reference to the future (see below)
         # qnam = QNetworkAccessManager(self)
         qnam = ImageLoader.networkAccessManagerInstance()
-        used_images = set().union(*map(set, self.recommendations))
         self.pending = {}
         for img_index, url in enumerate(self.urls):
-            if img_index not in used_images:
+            if img_index not in self.image_ranges:
                 continue
             future, deferred = image_loader(QUrl(url), qnam)
             f = deferred()
@@ -278,13 +373,12 @@ class CartoonTableModel(QAbstractTableModel):
             item = CartoonTableModel._Item(pixmap, None)
         img_index = self.pending.pop(f)
         self.image_cache[self.urls[img_index]] = item
-        for rowi, row in enumerate(self.recommendations):
-            for coli, rec_index in enumerate(row, start=1):
-                if rec_index == img_index:
-                    index = self.index(rowi, coli)
-                    self.dataChanged.emit(
-                        index, index,
-                        (Qt.ItemDataRole.DecorationRole, Qt.SizeHintRole))
+        cells = self.image_ranges.get(img_index)
+        if cells is not None:
+            top, left, bottom, right = cells
+            self.dataChanged.emit(
+                self.index(top, left), self.index(bottom, right),
+                (Qt.ItemDataRole.DecorationRole, Qt.SizeHintRole))
 
 
 class OWRecommendation(OWWidget):
@@ -313,8 +407,11 @@ class OWRecommendation(OWWidget):
         )
         invalid_node_data = Msg("Network data must be a table or a 1-d array")
 
+    Count, Weights, NormalizedWeights = range(3)
+
     item_column_hint: Optional[str] = settings.Setting(None)
     person_column_hint: Optional[str] = settings.Setting(None)
+    scoring: int = settings.Setting(Count)
 
     want_control_area = False
 
@@ -405,10 +502,11 @@ class OWRecommendation(OWWidget):
                 and columns are persons. **This is the opposite from
                 `network.nodes`.
 
-            choices (np.ndarray of dtype bool):
+            choices (csr_matrix of dtype bool):
                 if `data` is given, choices equal `data.X.T` so that
                 rows' names (persons, this is X.T!) correspond to person_names
                 (nodes in the network). Otherwise, it equals `network.nodes.X`.
+                Choices are kept sparse even if input data is dense.
 
             person_column (StringVariable): variable with names of persons,
                 or None if person can't be chosen (because it's taken from
@@ -439,6 +537,19 @@ class OWRecommendation(OWWidget):
         self.image_column = None
         self.urls = None
 
+        # Random noise for breaking ties; seeded for reproducible sessions
+        self._rng = np.random.default_rng(0)
+
+        box = gui.hBox(self.mainArea)
+        gui.comboBox(
+            box, self, "scoring", label="Score items by: ",
+            items=["Number of neighbours who chose them",
+                   "Sum of weights of edges to these neighbours",
+                   "Weights divided by neighbours' degrees"],
+            callback=self.update_page,
+            orientation=Qt.Horizontal)
+        gui.rubber(box)
+
         self.column_box = gui.hBox(self.mainArea)
         gui.comboBox(
             self.column_box, self, "person_column",
@@ -551,8 +662,8 @@ class OWRecommendation(OWWidget):
         else:
             domain = self.data.domain
             order = np.array([domain.index(name) for name in self.person_names])
-            choices = self.data.X.T[order]
-        self.choices = np.nan_to_num(choices).astype(bool)
+            choices = csc_matrix(self.data.X)[:, order].T
+        self.choices = choice_matrix(choices)
         self.update_page()
 
     def init_item_column(self):
@@ -664,12 +775,16 @@ class OWRecommendation(OWWidget):
             return
 
         friends = self.get_friends()
-        recommendations, recommenders = self.get_recommendations(5)
+        choices = self.choices
+
+        def recommenders(row, item):
+            return recommenders_of(friends[row][0], choices, item)
+
         self.rec_model.set_data(
             self.person_names, self.item_names, self.urls,
             friends,
-            [np.flatnonzero(row) for row in self.choices],
-            recommendations, recommenders)
+            chosen_items(choices),
+            self.get_recommendations(5), recommenders)
 
     def set_images(self):
         if self.image_column is None:
@@ -684,10 +799,18 @@ class OWRecommendation(OWWidget):
             self.urls.append(url)
 
     def get_friends(self):
+        """
+        Return neighbours of all persons and weights of edges, sorted by
+        decreasing weights; ties keep the order from the network.
+        """
         if not self.is_valid:
             return None
-        return [self._get_friends_one(row)
-                for row in range(len(self.person_names))]
+        matrix = self.network.edges[0].edges
+        rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+        order = np.lexsort((-matrix.data, rows))
+        bounds = matrix.indptr[1:-1]
+        return list(zip(np.split(matrix.indices[order], bounds),
+                        np.split(matrix.data[order], bounds)))
 
     def _get_friends_one(self, row):
         # TODO: when https://github.com/biolab/orange3-network/pull/273
@@ -702,33 +825,90 @@ class OWRecommendation(OWWidget):
         return neighs[inds], weights[inds]
 
     def get_recommendations(self, n):
+        """
+        Return arrays of up to `n` recommended items for all persons.
+
+        Recommenders of items are not computed here; see `recommenders_of`.
+
+        :param n: number of recommendations
+        """
         if not self.is_valid:
             return None
-        return list(zip(*(self._get_recommendations_one(row, n)
-                          for row in range(len(self.person_names)))))
+        return self._recommend(np.arange(len(self.person_names)), n)
 
     def _get_recommendations_one(self, row, n):
+        items = self._recommend(np.array([row]), n)[0]
         neighbours, _ = self._get_friends_one(row)
-        if len(neighbours) == 0:
-            return [], []
-
-        neighbours_choices = self.choices[neighbours]
-        counts = np.sum(neighbours_choices, axis=0)
-        counts[self.choices[row] == 1] = -1
-        # Add a bit of noise to break ties randomly
-        sorted_items = np.argsort(
-            np.random.uniform(0, 0.00001, len(counts)) - counts)
-        if n > len(sorted_items):
-            n = len(sorted_items)
-        if sorted_items[n - 1] == -1:
-            n = np.flatnonzero(sorted_items == -1)[0] - 1
-        if n == 0:
-            return [], []
-        most_freq = sorted_items[:n]
-        item_indices = list(most_freq)
-        recommenders = [
-            list(neighbours[neighbours_choices[:, i] == 1]) for i in most_freq]
-        return item_indices, recommenders
+        return (list(items),
+                [list(recommenders_of(neighbours, self.choices, item))
+                 for item in items])
+
+    def _scoring_matrix(self):
+        """
+        Return a sparse matrix whose product with choices gives scores of
+        items: adjacency matrix with ones, weights of edges, or weights
+        divided by degrees of neighbours, depending on `scoring`.
+        """
+        matrix = self.network.edges[0].edges
+        if self.scoring == self.Count:
+            data = np.ones(len(matrix.data))
+        else:
+            data = matrix.data.astype(float)
+            if self.scoring == self.NormalizedWeights:
+                degrees = np.maximum(np.diff(matrix.indptr), 1)
+                data = data / degrees[matrix.indices]
+        return csr_matrix((data, matrix.indices, matrix.indptr),
+                          shape=matrix.shape)
+
+    def _recommend(self, rows, n):
+        """
+        Return recommendations for persons in `rows`.
+
+        Items are ranked by scores, which are the numbers of neighbours who
+        chose them, or sums of (normalized) weights of edges to these
+        neighbours (see `_scoring_matrix`); items that the person already
+        chose are never recommended, and ties are broken randomly. Persons
+        without neighbours get no recommendations.
+
+        Scores for all persons are computed as a product of sparse scoring
+        and choice matrices, by chunks of persons whose dense scores have at
+        most `RECOMMENDATION_BUDGET` elements (but at least one person), and
+        the top `n` items of each person are selected with `argpartition`.
+
+        :param rows: indices of persons
+        :param n: number of recommendations
+        :return: list of arrays with indices of recommended items
+        """
+        adjacency = self._scoring_matrix()
+        choices = csr_matrix(self.choices, dtype=float)
+        n = min(n, choices.shape[1])
+        has_neighbours = np.diff(adjacency.indptr) > 0
+        chunk_size = max(1, RECOMMENDATION_BUDGET // max(choices.shape[1], 1))
+
+        recommendations = []
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            if n == 0:
+                recommendations += [np.empty(0, dtype=int) for _ in chunk]
+                continue
+            scores = (adjacency[chunk] @ choices).toarray()
+            # Noise must be smaller than differences between scores, so it
+            # only breaks ties: counts differ by at least 1
+            if self.scoring == self.Count:
+                noise = 0.5
+            else:
+                noise = 1e-9 * max(np.max(np.abs(scores), initial=0), 1)
+            scores += self._rng.uniform(0, noise, scores.shape)
+            scores[self.choices[chunk].nonzero()] = -np.inf
+            top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            known = np.isfinite(np.take_along_axis(top_scores, order, axis=1))
+            known &= has_neighbours[chunk, None]
+            recommendations += [items[item_known]
+                                for items, item_known in zip(top, known)]
+        return recommendations
 
 
 def main():
@@ -0,0 +1,57 @@
+import os
+import sys
+import json
+import unittest
+import subprocess
+
+# Budget for importing all widget modules, after their dependencies
+IMPORT_TIME = 0.5  # seconds
+IMPORT_MEMORY = 10 * 2 ** 20  # bytes
+
+# Widget modules are imported after their dependencies (Orange, add-ons),
+# so that only the cost of widget modules themselves is measured
+MEASURE_IMPORT = """
+import sys, json, time, importlib, pkgutil, tracemalloc, warnings
+
+import Orange.data, Orange.widgets.widget, Orange.widgets.utils.concurrent
+import Orange.widgets.utils.textimport, Orange.widgets.utils.itemmodels
+import Orange.classification.logistic_regression
+import orangecontrib.network
+import orangecontrib.imageanalytics.widgets.owimageviewer
+import orangecontrib.pumice.widgets as widgets
+
+warnings.simplefilter("ignore")
+names = [f"{widgets.__name__}.{module.name}"
+         for module in pkgutil.iter_modules(widgets.__path__)
+         if module.name.startswith("ow")]
+if sys.argv[1] == "time":
+    start = time.perf_counter()
+    for name in names:
+        importlib.import_module(name)
+    print(json.dumps(time.perf_counter() - start))
+else:
+    tracemalloc.start()
+    for name in names:
+        importlib.import_module(name)
+    print(json.dumps(tracemalloc.get_traced_memory()[1]))
+"""
+
+
+class TestImport(unittest.TestCase):
+    @staticmethod
+    def measure(what):
+        env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+        output = subprocess.run(
+            [sys.executable, "-c", MEASURE_IMPORT, what],
+            env=env, capture_output=True, text=True, check=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def test_import_time(self):
+        self.assertLess(self.measure("time"), IMPORT_TIME)
+
+    def test_import_memory(self):
+        self.assertLess(self.measure("memory"), IMPORT_MEMORY)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,511 @@
+import calendar
+import threading
+import unittest
+from contextlib import contextmanager
+from functools import cache
+from unittest.mock import patch
+
+import numpy as np
+
+from Orange.data import Table, Domain, ContinuousVariable, DiscreteVariable
+from Orange.widgets.tests.base import WidgetTest
+
+from orangecontrib.pumice.widgets import owclimatedata
+from orangecontrib.pumice.widgets.owclimatedata import \
+    OWClimateData, station_data
+
+
+class SyntheticArray:
+    """
+    Stand-in for arrays of stations by decades and of daily values, which
+    are too large to ship with the package; values are computed only for
+    the requested rows.
+    """
+    def __init__(self, shape):
+        self.shape = shape
+
+    def __getitem__(self, rows):
+        rows = np.arange(self.shape[0])[rows]
+        columns = np.arange(int(np.prod(self.shape[1:])))
+        values = 100 + 50 * np.sin(rows[:, None] + 0.1 * columns)
+        values[(rows[:, None] + columns) % 7 == 0] = np.nan
+        return values.reshape((len(rows), ) + self.shape[1:])
+
+
+@contextmanager
+def synthetic_arrays(partitions=None):
+    """
+    Provide synthetic arrays of stations by decades, and of daily values in
+    the given partitions ({year: prefix}, by default only "S-Y-" for 2024).
+    """
+    if partitions is None:
+        partitions = {2024: "S-Y-"}
+    names = station_data().get_column("Station")
+    nstations = len(names)
+    ndays = {prefix: 365 + calendar.isleap(year)
+             for year, prefix in partitions.items()}
+    mask = (np.arange(nstations) % 3 == 0) \
+        | (names == owclimatedata.DefaultStation)
+    orig_get_array = owclimatedata.get_array
+
+    def get_array(name):
+        if name.startswith("S-MD-"):
+            return SyntheticArray((nstations, 12, 13))
+        for prefix, days in ndays.items():
+            if name == prefix + "mask":
+                return mask
+            if name.startswith(prefix):
+                return SyntheticArray((nstations, days))
+        return orig_get_array(name)
+
+    with patch.object(owclimatedata, "get_array", get_array), \
+            patch.object(owclimatedata, "daily_prefixes", lambda: partitions), \
+            patch.object(owclimatedata, "daily_stations",
+                         cache(owclimatedata.daily_stations.__wrapped__)):
+        yield
+
+
+class TestOWClimateData(WidgetTest):
+    def setUp(self):
+        self.widget: OWClimateData = self.create_widget(OWClimateData)
+
+    def get_data(self):
+        w = self.widget
+        self.process_events(lambda: not w._update_timer.isActive())
+        self.wait_until_finished(w)
+        return self.get_output(w.Outputs.data)
+
+    def test_minimum_size(self):
+        pass
+
+    def test_countries(self):
+        w = self.widget
+        w.controls.geo_selection.buttons[w.Countries].click()
+        data = self.get_data()
+        self.assertEqual(len(data.domain.attributes), 12)
+        self.assertEqual([var.name for var in data.domain.metas],
+                         ["Country", "Continent"])
+
+        w.controls.geo_selection.buttons[w.CountriesOnContinent].click()
+        on_continent = self.get_data()
+        self.assertLess(len(on_continent), len(data))
+
+    def test_station_countries(self):
+        codes, ncountries = owclimatedata.station_countries()
+        names = owclimatedata.countries_continents()[:, 0]
+        self.assertEqual(ncountries, len(names))
+        station_countries = station_data().get_column("Country")
+        known = codes >= 0
+        np.testing.assert_equal(names[codes[known]],
+                                station_countries[known])
+        self.assertFalse(set(station_countries[~known]) & set(names))
+
+    def test_no_values(self):
+        w = self.widget
+        w.controls.get_temperature.click()
+        self.assertFalse(w.get_precipitation)
+        self.assertIsNone(self.get_data())
+
+    def test_bursts_merged(self):
+        w = self.widget
+        self.get_data()
+        with patch.object(w, "start") as start:
+            w.continent_changed()
+            w.value_selection_changed()
+            self.process_events(lambda: not w._update_timer.isActive())
+            start.assert_called_once()
+
+    def test_output_cache(self):
+        w = self.widget
+        w.controls.geo_selection.buttons[w.Countries].click()
+        data = self.get_data()
+        w.controls.get_precipitation.click()
+        with_prec = self.get_data()
+        self.assertIsNot(with_prec, data)
+
+        with patch.object(w, "start") as start:
+            w.controls.get_precipitation.click()
+            self.assertIs(self.get_data(), data)
+            w.controls.get_precipitation.click()
+            self.assertIs(self.get_data(), with_prec)
+            start.assert_not_called()
+
+        # Month is irrelevant for all-time means
+        with patch.object(w, "start") as start:
+            w.month_index = 3
+            w.value_selection_changed()
+            self.assertIs(self.get_data(), with_prec)
+            start.assert_not_called()
+
+        self.send_signal(w.Inputs.stations, None)
+        with patch.object(w, "start") as start:
+            w.update_data()
+            self.assertIs(self.get_data(), with_prec)
+            start.assert_not_called()
+
+    def test_stable_domain(self):
+        w = self.widget
+        w.country = "Slovenia"
+        w.country_changed()
+        data = self.get_data()
+        self.assertEqual([var.name for var in data.domain.metas], ["Station"])
+        w.country = "Austria"
+        w.country_changed()
+        austria = self.get_data()
+        self.assertIsNot(austria, data)
+        self.assertIs(austria.domain, data.domain)
+
+    @synthetic_arrays()
+    def test_decades_monthly(self):
+        w = self.widget
+        w.time_selection = w.MonthlyByDecades
+        w.geo_selection = w.SingleStation
+        w.time_selection_changed()
+        station = self.get_data()
+        self.assertEqual(len(station), len(owclimatedata.Decades))
+        self.assertEqual([var.name for var in station.domain.metas],
+                         ["Decade"])
+
+        w.country = "Slovenia"
+        w.country_changed()
+        data = self.get_data()
+        self.assertEqual([var.name for var in data.domain.metas],
+                         ["Station", "Decade"])
+        self.assertEqual(len(data.domain.attributes), 12)
+        self.assertFalse(np.isnan(data.X).all(axis=1).any())
+
+        # Rows of a station match the output for the single station
+        rows = data.get_column("Station") == w.station
+        decades = data.get_column("Decade")[rows].astype(int)
+        np.testing.assert_equal(data.X[rows], station.X[decades])
+
+        w.controls.get_precipitation.click()
+        self.assertEqual(len(self.get_data().domain.attributes), 24)
+
+        w.controls.geo_selection.buttons[w.Countries].click()
+        data = self.get_data()
+        self.assertEqual([var.name for var in data.domain.metas],
+                         ["Country", "Continent", "Decade"])
+
+        self.send_signal(w.Inputs.stations, station_data()[:3])
+        self.assertEqual(
+            len(set(self.get_data().get_column("Station"))), 3)
+
+    def test_last_year_monthly(self):
+        w = self.widget
+        w.controls.time_selection.buttons[w.LastYearMonthly].click()
+        w.controls.geo_selection.buttons[w.Country].click()
+        w.country = "Slovenia"
+        w.country_changed()
+        stations = self.get_data()
+        self.assertEqual([var.name for var in stations.domain.attributes],
+                         owclimatedata.MonthTempAttrs)
+        indices = owclimatedata.station_index().by_country("Slovenia")
+        year = owclimatedata.last_monthly_year()
+        np.testing.assert_almost_equal(
+            stations.X,
+            owclimatedata.get_array(f"S-M{year}-tavg")[indices], decimal=5)
+
+        w.controls.geo_selection.buttons[w.Countries].click()
+        data = self.get_data()
+        row = list(data.get_column("Country")).index("Slovenia")
+        np.testing.assert_almost_equal(
+            data.X[row], np.nanmean(stations.X, axis=0), decimal=5)
+
+    def test_daily_years(self):
+        # Both years are read from the same partition
+        with synthetic_arrays({2020: "S-Y-", 2024: "S-Y-"}):
+            self.widget = w = self.create_widget(OWClimateData)
+            self.assertEqual((w.first_year, w.last_year), (2024, 2024))
+            w.controls.time_selection.buttons[w.DailyValues].click()
+            data = self.get_data()
+            self.assertEqual(len(data.domain.attributes), 366)
+            self.assertEqual(data.domain.attributes[0].name, "T-Jan 1")
+
+            w.first_year = 2020
+            w.first_year_changed()
+            data = self.get_data()
+            self.assertEqual(len(data.domain.attributes), 2 * 366)
+            self.assertEqual(data.domain.attributes[366].name, "T-2024 Jan 1")
+            np.testing.assert_equal(data.X[:, :366], data.X[:, 366:])
+
+            w.last_year = 2022
+            w.last_year_changed()
+            self.assertEqual(len(self.get_data().domain.attributes), 366)
+
+            w.first_year = 2021
+            w.first_year_changed()
+            self.assertEqual(w.last_year, 2022)
+            self.assertIsNone(self.get_data())
+            self.assertTrue(w.Error.no_daily_values.is_shown())
+
+    @synthetic_arrays()
+    def test_anomalies(self):
+        w = self.widget
+        w.controls.time_selection.buttons[w.MonthMeanByDecades].click()
+        self.assertTrue(w.anomalies_box.isEnabled())
+        w.month_index = 6
+        w.month_changed()
+        data = self.get_data()
+
+        w.baseline = 1  # 1960-1989
+        w.baseline_changed()
+        self.assertTrue(w.anomalies)
+        diffs = self.get_data()
+        self.assertEqual(diffs.domain.attributes[0].name, "ΔT-1900-09")
+        expected = data.X - np.nanmean(data.X[:, 6:9], axis=1)[:, None]
+        np.testing.assert_almost_equal(diffs.X, expected, decimal=4)
+
+        w.controls.time_selection.buttons[w.MonthlyByDecades].click()
+        w.controls.geo_selection.buttons[w.SingleStation].click()
+        diffs = self.get_data()
+        self.assertEqual(diffs.domain.attributes[0].name, "ΔT-Jan")
+        # Months without data in the baseline have no differences
+        baseline = diffs.X[6:9]
+        known = ~np.isnan(baseline).all(axis=0)
+        self.assertTrue(np.isnan(diffs.X[:, ~known]).all())
+        np.testing.assert_almost_equal(
+            np.nanmean(baseline[:, known], axis=0), 0, decimal=4)
+
+        w.controls.time_selection.buttons[w.TotalMonthly].click()
+        self.assertFalse(w.anomalies_box.isEnabled())
+        self.assertEqual(self.get_data().domain.attributes[0].name, "T-Jan")
+
+    def test_day_periods(self):
+        for year in (2023, 2024):
+            for resolution, nperiods in ((OWClimateData.Days, 337),
+                                         (OWClimateData.Weeks, 52),
+                                         (OWClimateData.TenDays, 36),
+                                         (OWClimateData.Seasons, 4)):
+                codes, names = owclimatedata.day_periods(year, resolution)
+                self.assertEqual(len(codes), 365 + (year == 2024))
+                self.assertEqual(codes.max() + 1, len(names))
+                if resolution != OWClimateData.Days:
+                    self.assertEqual(len(names), nperiods)
+                    self.assertTrue(np.all(np.diff(codes[:334]) >= 0))
+
+        codes, names = owclimatedata.day_periods(2024, OWClimateData.TenDays)
+        self.assertEqual(names[5], "Feb 21-29")
+        np.testing.assert_equal(np.bincount(codes)[3:6], [10, 10, 9])
+        codes, names = owclimatedata.day_periods(2024, OWClimateData.Seasons)
+        np.testing.assert_equal(np.bincount(codes), [31 + 29 + 31, 92, 92, 91])
+        self.assertEqual(codes[-1], 0)
+
+    @synthetic_arrays()
+    def test_daily_resolution(self):
+        # Create the widget with daily values
+        self.widget = w = self.create_widget(OWClimateData)
+        w.controls.time_selection.buttons[w.DailyValues].click()
+        w.controls.get_precipitation.click()
+        daily = self.get_data()
+
+        w.daily_resolution = w.Weeks
+        w._daily_changed()
+        weekly = self.get_data()
+        self.assertEqual(len(weekly.domain.attributes), 2 * 52)
+        self.assertEqual(weekly.domain.attributes[0].name, "T-Week 1")
+        np.testing.assert_almost_equal(
+            weekly.X[:, 0], np.nanmean(daily.X[:, :7], axis=1), decimal=4)
+        # Precipitation is summed over days
+        ndays = len(daily.domain.attributes) // 2
+        np.testing.assert_almost_equal(
+            weekly.X[:, 52],
+            np.nanmean(daily.X[:, ndays:ndays + 7], axis=1) * 7, decimal=3)
+
+        w.daily_resolution = w.Seasons
+        w._daily_changed()
+        self.assertEqual(self.get_data().domain.attributes[1].name,
+                         "T-Spring")
+
+    def test_parallel_loading(self):
+        w = self.widget
+        w.controls.geo_selection.buttons[w.Countries].click()
+        self.get_data()
+        w.controls.get_precipitation.click()
+        # Both arrays must be requested at the same time to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
+        orig_get_array = owclimatedata.get_array
+
+        def get_array(name):
+            barrier.wait()
+            return orig_get_array(name)
+
+        with patch.object(owclimatedata, "get_array", get_array):
+            data = self.get_data()
+        self.assertEqual(len(data.domain.attributes), 24)
+
+    def test_load_error(self):
+        w = self.widget
+        w.controls.geo_selection.buttons[w.Countries].click()
+
+        def get_array(name):
+            raise FileNotFoundError(name)
+
+        with patch.object(owclimatedata, "get_array", get_array):
+            w.controls.get_precipitation.click()
+            self.assertIsNone(self.get_data())
+            self.assertTrue(w.Error.load_error.is_shown())
+
+        w.controls.get_precipitation.click()
+        self.assertIsNotNone(self.get_data())
+        self.assertFalse(w.Error.load_error.is_shown())
+
+    def test_near_location(self):
+        w = self.widget
+        w.location = "46.07, 14.51"
+        w.near_count = 5
+        w.near_location_changed()
+        data = self.get_data()
+        self.assertEqual(w.geo_selection, w.NearLocation)
+        self.assertEqual(len(data), 5)
+        self.assertEqual([var.name for var in data.domain.metas],
+                         ["Station", "Distance [km]"])
+        distances = data.get_column("Distance [km]")
+        self.assertTrue(np.all(np.diff(distances) >= 0))
+        self.assertTrue(np.all(distances <= w.near_radius))
+
+        # Coordinates may be given without leading or trailing digits
+        for text, coords in ((".5, 14.5", (0.5, 14.5)),
+                             ("-.25 30", (-0.25, 30)),
+                             ("46., +14", (46, 14))):
+            self.assertEqual(owclimatedata.locate(text), coords)
+
+        w.location = "ljubljana bezigrad"
+        w.near_count = 1
+        w.near_location_changed()
+        data = self.get_data()
+        self.assertEqual(data.metas[0, 0], "LJUBLJANA BEZIGRAD, SI")
+
+        w.location = "no such place"
+        w.near_location_changed()
+        self.assertIsNone(self.get_data())
+        self.assertTrue(w.Error.unknown_location.is_shown())
+
+        w.location = "0, -30"
+        w.near_location_changed()
+        self.assertIsNone(self.get_data())
+        self.assertTrue(w.Error.no_stations_near.is_shown())
+
+    def test_area(self):
+        w = self.widget
+        w.area = "45.5, 13.5, 46.9, 16.6"
+        w.area_changed()
+        data = self.get_data()
+        self.assertEqual(w.geo_selection, w.InArea)
+        countries = set(data.get_column("Country"))
+        self.assertIn("Slovenia", countries)
+        self.assertNotIn("Germany", countries)
+        in_box = len(data)
+
+        # Triangle: half of the box
+        w.area = "45.5, 13.5; 46.9, 13.5; 45.5, 16.6"
+        w.area_changed()
+        self.assertLess(len(self.get_data()), in_box)
+
+        w.area = "45.5, 13.5, 46.9"
+        w.area_changed()
+        self.assertIsNone(self.get_data())
+        self.assertTrue(w.Error.invalid_area.is_shown())
+
+        w.area = "0, -30, 1, -29"
+        w.area_changed()
+        self.assertIsNone(self.get_data())
+        self.assertTrue(w.Error.no_stations_in_area.is_shown())
+
+        domain = Domain([ContinuousVariable("Latitude"),
+                         ContinuousVariable("Longitude")])
+        vertices = Table.from_list(domain, [[45.5, 13.5], [46.9, 16.6]])
+        w.geo_selection = w.Country
+        self.send_signal(w.Inputs.area, vertices)
+        self.assertEqual(w.geo_selection, w.InArea)
+        self.assertFalse(w.controls.area.isEnabled())
+        self.assertEqual(len(self.get_data()), in_box)
+
+        # Corners of the box in input may come in any order
+        for corners in ([[46.9, 13.5], [45.5, 16.6]],
+                        [[45.5, 16.6], [46.9, 13.5]]):
+            self.send_signal(w.Inputs.area, Table.from_list(domain, corners))
+            self.assertEqual(len(self.get_data()), in_box)
+
+        self.send_signal(w.Inputs.area, vertices[:1])
+        self.assertTrue(w.Error.invalid_area_input.is_shown())
+        self.send_signal(w.Inputs.area, None)
+        self.assertFalse(w.Error.invalid_area_input.is_shown())
+        self.assertTrue(w.controls.area.isEnabled())
+
+    def test_aggregation(self):
+        w = self.widget
+        w.area = "45.5, 13.5, 46.9, 16.6"
+        w.area_changed()
+        stations = self.get_data()
+
+        w.group_by = "Country"
+        w.aggregation_changed()
+        data = self.get_data()
+        self.assertEqual([var.name for var in data.domain.metas],
+                         ["Country", "Stations"])
+        self.assertEqual(list(data.get_column("Country")),
+                         sorted(set(stations.get_column("Country"))))
+        self.assertEqual(data.get_column("Stations").sum(), len(stations))
+        slovenia = stations.get_column("Country") == "Slovenia"
+        row = list(data.get_column("Country")).index("Slovenia")
+        np.testing.assert_almost_equal(
+            data.X[row], np.nanmean(stations.X[slovenia], axis=0), decimal=5)
+
+        w.aggregation = 2
+        w.aggregation_changed()
+        np.testing.assert_almost_equal(
+            self.get_data().X[row], np.nanmax(stations.X[slovenia], axis=0))
+
+        w.group_by = "Elevation band"
+        w.aggregation_changed()
+        self.assertTrue(all(label.endswith(" m")
+                            for label in self.get_data().get_column("Elevation band")))
+
+        # Groups from a discrete column of input data
+        input_data = station_data()[:6]
+        var = DiscreteVariable("Group", values=("a", "b"))
+        input_data = input_data.add_column(var, [0, 1, 0, 1, 0, np.nan])
+        self.send_signal(w.Inputs.stations, input_data)
+        self.assertEqual(w.group_by, "Elevation band")
+        w.group_by = "Group"
+        w.aggregation_changed()
+        data = self.get_data()
+        self.assertEqual(list(data.get_column("Group")), ["a", "b"])
+        self.assertEqual(list(data.get_column("Stations")), [3, 2])
+
+        # Same stations, different groups
+        input_data = input_data.copy()
+        with input_data.unlocked():
+            input_data.set_column(var, [0, 0, 0, 1, 1, 1])
+        self.send_signal(w.Inputs.stations, input_data)
+        data = self.get_data()
+        self.assertEqual(list(data.get_column("Stations")), [3, 3])
+
+        self.send_signal(w.Inputs.stations, None)
+        self.assertEqual(w.group_by, "None")
+
+        # Grouping is disabled where stations are not aggregated
+        self.assertTrue(w.group_box.isEnabled())
+        w.controls.geo_selection.buttons[w.Countries].click()
+        self.assertFalse(w.group_box.isEnabled())
+        w.controls.geo_selection.buttons[w.Country].click()
+        self.assertTrue(w.group_box.isEnabled())
+        w.controls.time_selection.buttons[w.MonthlyByDecades].click()
+        self.assertFalse(w.group_box.isEnabled())
+
+    def test_output_cache_input(self):
+        w = self.widget
+        self.send_signal(w.Inputs.stations, station_data()[:3])
+        data = self.get_data()
+        self.assertEqual(len(data), 3)
+        with patch.object(w, "start") as start:
+            self.send_signal(w.Inputs.stations, station_data()[:3].copy())
+            self.assertIs(self.get_data(), data)
+            start.assert_not_called()
+        self.send_signal(w.Inputs.stations, station_data()[1:3])
+        self.assertEqual(len(self.get_data()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,18 +1,23 @@
 import unittest
+from concurrent.futures import Future
 from unittest.mock import Mock, patch
 
 import numpy as np
 from scipy.sparse import csr_matrix
 
+from AnyQt.QtCore import Qt
+from AnyQt.QtGui import QImage
+
 from Orange.data import Domain, Table, StringVariable, ContinuousVariable, \
     DiscreteVariable
-from Orange.widgets.tests.base import WidgetTest
+from Orange.widgets.tests.base import WidgetTest, GuiTest
 
 from orangecontrib.network import Network
 # TODO: when DirectedEdges is reexported from network, import it from there
 from orangecontrib.network.network.base import DirectedEdges
 
-from orangecontrib.pumice.widgets.owrecommendation import OWRecommendation
+from orangecontrib.pumice.widgets.owrecommendation import (
+    OWRecommendation, CartoonTableModel, recommenders_of)
 
 
 class TestOWRecommendation(WidgetTest):
@@ -388,13 +393,13 @@ class TestOWRecommendation(WidgetTest):
         self.assertEqual([v.name for v in w.person_column_model], ["name", "name2"])
         self.assertEqual(w.person_column.name, "name")
         np.testing.assert_equal(w.person_names, self.names)
-        np.testing.assert_equal(w.choices, self.data_name.X.T)
+        np.testing.assert_equal(w.choices.toarray(), self.data_name.X.T)
 
         update_page.reset_mock()
         combo.setCurrentIndex(1)
         combo.activated.emit(1)
         np.testing.assert_equal(w.person_names, self.names[::-1])
-        np.testing.assert_equal(w.choices, self.data_name.X.T[::-1])
+        np.testing.assert_equal(w.choices.toarray(), self.data_name.X.T[::-1])
         update_page.assert_called()
 
     def test_set_person_names(self):
@@ -404,7 +409,29 @@ class TestOWRecommendation(WidgetTest):
 
         w._set_person_names(np.array(self.names[3:] + self.names[:3]))
         arr = self.data_name.X.T
-        np.testing.assert_equal(w.choices, np.vstack((arr[3:], arr[:3])))
+        np.testing.assert_equal(w.choices.toarray(), np.vstack((arr[3:], arr[:3])))
+
+    def test_sparse_choices(self):
+        w = self.widget
+        nodes = self.network_one_name.nodes
+        x = nodes.X.copy()
+        x[0, 0] = np.nan
+        data = Table.from_numpy(nodes.domain, csr_matrix(x), metas=nodes.metas)
+        self.send_signal(w.Inputs.network,
+                         Network(data, DirectedEdges(self.edges)))
+        self.assertIsInstance(w.choices, csr_matrix)
+        self.assertEqual(w.choices.dtype, bool)
+        np.testing.assert_equal(w.choices.toarray(), np.nan_to_num(x))
+        np.testing.assert_equal(w.rec_model.chosen_items[0], [2, 3, 5])
+
+        data = self.data_name
+        data = Table.from_numpy(data.domain, csr_matrix(data.X),
+                                metas=data.metas)
+        self.send_signal(w.Inputs.network, self.network_more_names)
+        self.send_signal(w.Inputs.item_data, data)
+        self.assertIsInstance(w.choices, csr_matrix)
+        np.testing.assert_equal(w.choices.toarray(), self.data_name.X.T)
+        self.assertTrue(w.is_valid)
 
     def test_person_column_hint(self):
         w = self.widget
@@ -489,6 +516,32 @@ class TestOWRecommendation(WidgetTest):
         self.assertTrue(w.is_valid)
         w.rec_model.set_data.assert_called()
 
+    def test_lazy_recommenders(self):
+        w = self.widget
+        self.send_signal(w.Inputs.network, self.network_one_name)
+        model = w.rec_model
+        # The view may already have asked for visible cells
+        model.recommenders_cache.clear()
+
+        # Ana's neighbours are Franz, Benjamin, Dani, Ema and Greta
+        row = 1
+        items = model.recommendations[row]
+        neighbours = w.get_friends()[row][0]
+        with patch("orangecontrib.pumice.widgets.owrecommendation."
+                   "RECOMMENDERS_CACHE_SIZE", 2):
+            for column, item in enumerate(items):
+                np.testing.assert_equal(
+                    model.get_recommenders(row, column),
+                    neighbours[self.choices[neighbours, item] == 1])
+            self.assertEqual(list(model.recommenders_cache),
+                             [(row, len(items) - 2), (row, len(items) - 1)])
+
+        index = model.index(list(model.row_order).index(row), 1)
+        self.assertIn("\x00(", model.data(index, Qt.DisplayRole))
+
+        model.reset()
+        self.assertEqual(len(model.recommenders_cache), 0)
+
     def test_get_friends_one(self):
         w = self.widget
         self.network_one_name.edges[0].edges[1, 3] = 0.5
@@ -515,6 +568,68 @@ class TestOWRecommendation(WidgetTest):
                           [], [1, 3, 5]])
         np.testing.assert_almost_equal(w.get_friends()[1][1], [1, 1, 1, 1, 0.5])
 
+    def test_get_recommendations(self):
+        w = self.widget
+        rng = np.random.default_rng(42)
+        npersons, nitems = 300, 12
+        edges = csr_matrix(rng.random((npersons, npersons)) < 0.02)
+        edges.data = rng.choice([0.5, 1], len(edges.data))
+        choices = (rng.random((npersons, nitems)) < 0.3).astype(float)
+        domain = Domain([ContinuousVariable(f"i{i}") for i in range(nitems)],
+                        None, [StringVariable("name")])
+        data = Table.from_numpy(
+            domain, choices,
+            metas=np.array([f"p{i}" for i in range(npersons)])[:, None])
+        self.send_signal(w.Inputs.network,
+                         Network(data, DirectedEdges(edges)))
+
+        with patch("orangecontrib.pumice.widgets.owrecommendation."
+                   "RECOMMENDATION_BUDGET", 64 * nitems + 5):
+            recommendations = w.get_recommendations(5)
+        self.assertEqual(len(recommendations), npersons)
+        friends = w.get_friends()
+        for row, items in enumerate(recommendations):
+            neighbours = edges[row].indices
+            if not len(neighbours):
+                self.assertEqual(len(items), 0)
+                continue
+            unchosen = np.flatnonzero(choices[row] == 0)
+            counts = choices[neighbours].sum(axis=0)
+            self.assertEqual(len(items), min(5, len(unchosen)))
+            self.assertTrue(set(items) <= set(unchosen))
+            item_counts = counts[items]
+            self.assertTrue(np.all(np.diff(item_counts) <= 0))
+            # No better item was omitted
+            self.assertGreaterEqual(
+                item_counts[-1] if len(items) else 0,
+                np.max(counts[np.setdiff1d(unchosen, items)], initial=0))
+            for item in items:
+                self.assertEqual(
+                    set(recommenders_of(friends[row][0], w.choices, item)),
+                    set(neighbours[choices[neighbours, item] == 1]))
+
+    def test_weighted_scoring(self):
+        w = self.widget
+        self.network_one_name.edges[0].edges[1, 3] = 0.5
+        self.send_signal(w.Inputs.network, self.network_one_name)
+
+        recs = w._get_recommendations_one(1, 5)[0]
+        self.assertEqual(recs[0], 1)
+        self.assertEqual(set(recs[1:3]), {2, 5})
+
+        w.scoring = w.Weights
+        for _ in range(5):
+            recs = w._get_recommendations_one(1, 5)[0]
+            self.assertEqual(recs[:3], [1, 2, 5])
+            self.assertEqual(set(recs[3:]), {3, 7})
+
+        # Greta (3) has a single neighbour, so her choices weigh more
+        w.scoring = w.NormalizedWeights
+        for _ in range(5):
+            recs = w._get_recommendations_one(1, 5)[0]
+            self.assertEqual(recs[:3], [1, 5, 2])
+            self.assertEqual(set(recs[3:]), {3, 7})
+
     def test_get_recommendations_one(self):
         w = self.widget
         self.network_one_name.edges[0].edges[1, 3] = 0.5
@@ -545,5 +660,40 @@ class TestOWRecommendation(WidgetTest):
                 self.send_signal(w.Inputs.item_data, self.data_name)
 
 
+class TestCartoonTableModel(GuiTest):
+    def setUp(self):
+        self.model = CartoonTableModel()
+        # Rows are sorted by names: Ana (1), Cilka (2), Dani (0)
+        self.model.set_data(
+            np.array(["Dani", "Ana", "Cilka"]), np.array(list("ABCD")), None,
+            [(np.array([1]), np.ones(1))] * 3,
+            [np.array([], dtype=int)] * 3,
+            [np.array([2, 0]), np.array([0, 1, 3]), np.array([], dtype=int)],
+            Mock())
+
+    def test_image_ranges(self):
+        self.assertEqual(self.model.image_ranges,
+                         {0: (0, 1, 2, 2), 1: (0, 2, 0, 2),
+                          2: (2, 1, 2, 1), 3: (0, 3, 0, 3)})
+        self.model.reset()
+        self.assertEqual(self.model.image_ranges, {})
+
+    def test_future_done_emits_range(self):
+        model = self.model
+        model.urls = list("abcd")
+        future = Future()
+        model.pending = {future: 2}
+        future.set_result(QImage(10, 10, QImage.Format_RGB32))
+        changed = Mock()
+        model.dataChanged.connect(changed)
+        model._CartoonTableModel__on_future_done(future)
+
+        changed.assert_called_once()
+        top_left, bottom_right, _ = changed.call_args[0]
+        self.assertEqual((top_left.row(), top_left.column()), (2, 1))
+        self.assertEqual((bottom_right.row(), bottom_right.column()), (2, 1))
+        self.assertIsNotNone(model.image_cache["c"].image)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -60,7 +60,10 @@ setup(
     long_description_content_type='text/markdown',
     packages=find_packages(),
     package_data={
-        "orangecontrib.pumice": ["datasets/*.xlsx", "datasets/weather/*.pkl.gz"],
+        "orangecontrib.pumice": ["datasets/*.xlsx", "datasets/weather/*.pkl.gz",
+                                 "datasets/weather/*.npy",
+                                 "datasets/weather/*.enc",
+                                 "datasets/weather/*.blocks"],
         "orangecontrib.pumice.widgets": ["icons/*.svg"]},
     entry_points=ENTRY_POINTS,
     install_requires=INSTALL_REQUIRES,